@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, User, RefreshToken
+
+# ------------------------ AUTH ------------------------
+# Users and refresh tokens live in SQLite (indexed on username / token hash).
+# Verified access tokens are kept in a bounded TTL cache, so authenticating a
+# request normally costs one dict lookup and no JWT decode or database access.
+
+# JWT settings
+# Every web worker and node must share SECRET_KEY to accept each other's tokens
+SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+# Verified access tokens kept in memory, and for how long at most
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "4096"))
+TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL", "300"))
+
+class InvalidToken(Exception):
+    pass
+
+def hash_password(password: str) -> str:
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def token_digest(token: str) -> str:
+    # Refresh tokens are stored hashed, so a leaked database does not leak sessions
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "type": "access"})
+    from jose import jwt
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    # jti keeps two tokens issued in the same second distinct
+    to_encode.update({"exp": expire, "jti": os.urandom(8).hex(), "type": "refresh"})
+    from jose import jwt
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_token(token: str, token_type: str):
+    """ (username, exp timestamp) of a valid JWT of the given type ("access"
+    or "refresh"); raises InvalidToken. The type claim keeps a refresh
+    token from being used as a bearer token after it is revoked. """
+    # python-jose is imported on first use to keep startup cheap
+    from jose import jwt, JWTError
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise InvalidToken()
+    username = payload.get("sub")
+    if username is None or payload.get("type") != token_type:
+        raise InvalidToken()
+    return username, payload.get("exp")
+
+class TokenCache:
+    """ LRU of token -> username, each entry valid until the earlier of the
+    token's own expiry and TOKEN_CACHE_TTL seconds after it was verified. """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            username, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+            return username
+
+    def put(self, token, username, token_expiry=None):
+        expires_at = time.time() + self.ttl
+        if token_expiry is not None:
+            expires_at = min(expires_at, token_expiry)
+        with self.lock:
+            self.entries[token] = (username, expires_at)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+_token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+def verify_access_token(token: str) -> str:
+    """ Username for a valid access token; raises InvalidToken. """
+    username = _token_cache.get(token)
+    if username is not None:
+        return username
+    username, expiry = decode_token(token, "access")
+    _token_cache.put(token, username, expiry)
+    return username
+
+# ------------------------ USERS ------------------------
+
+def authenticate(username, password):
+    session = SessionLocal()
+    try:
+        user = session.query(User).filter(User.username == username).first()
+        return user is not None and user.password == hash_password(password)
+    finally:
+        session.close()
+
+def create_user(username, password_hash):
+    """ Returns False when the username is taken. """
+    session = SessionLocal()
+    try:
+        session.add(User(username=username, password=password_hash))
+        session.commit()
+        return True
+    except IntegrityError:
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+# ------------------------ REFRESH TOKENS ------------------------
+
+def issue_refresh_token(username):
+    token = create_refresh_token(data={"sub": username})
+    session = SessionLocal()
+    try:
+        session.add(RefreshToken(
+            token_hash=token_digest(token),
+            username=username,
+            expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        ))
+        session.commit()
+    finally:
+        session.close()
+    return token
+
+def check_refresh_token(token):
+    """ Username for a valid, unrevoked refresh token; raises InvalidToken. """
+    username, _ = decode_token(token, "refresh")
+    session = SessionLocal()
+    try:
+        stored = session.get(RefreshToken, token_digest(token))
+        if stored is None or stored.revoked_at is not None or stored.username != username:
+            raise InvalidToken()
+        return username
+    finally:
+        session.close()
+
+def revoke_refresh_token(token):
+    """ Returns False when the token is unknown. """
+    session = SessionLocal()
+    try:
+        updated = session.query(RefreshToken).filter(
+            RefreshToken.token_hash == token_digest(token), RefreshToken.revoked_at.is_(None)
+        ).update({"revoked_at": datetime.utcnow()})
+        session.commit()
+        return updated > 0
+    finally:
+        session.close()
+
+def purge_expired_refresh_tokens():
+    session = SessionLocal()
+    try:
+        deleted = session.query(RefreshToken).filter(RefreshToken.expires_at < datetime.utcnow()).delete()
+        session.commit()
+        return deleted
+    finally:
+        session.close()
+
+# ------------------------ MIGRATION ------------------------
+
+def migrate_users(path="users.json"):
+    """ Import users from the old TinyDB users.json; existing usernames are
+    skipped. Stored refresh tokens are not carried over, so those sessions
+    log in again once their access token expires. """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    migrated = 0
+    for table in data.values():
+        for record in table.values():
+            if record.get("username") and record.get("password"):
+                migrated += create_user(record["username"], record["password"])
+    return migrated
@@ -0,0 +1,239 @@
+""" OCR benchmark over the sample PDFs.
+
+Usage:
+    python benchmark.py [pdf ...] [--lang auto] [--preprocess legacy] [--workers N]
+                        [--ground-truth DIR] [--output results.json]
+                        [--baseline benchmark_baseline.json] [--save-baseline | --no-baseline]
+
+Runs extract_text_from_pdf on every PDF (default: uploads/*.pdf) with the OCR
+result cache disabled. Each document runs in a fresh process, so its peak RSS
+is its own and not the high-water mark of the documents before it. For each
+document it records pages/sec, peak RSS and the per-stage times. When
+DIR/<pdf name>.txt exists it also reports the character error rate (CER);
+pages in the ground truth file are separated by form feeds (\\f). Results are
+written as JSON. The run exits with status 1 when a document got slower than
+--max-slowdown or its CER rose by more than --max-cer-increase compared with
+the baseline, and with status 2 when there is no baseline to compare with
+(record one with --save-baseline, or pass --no-baseline to skip the check).
+"""
+import argparse
+import glob
+import multiprocessing
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ocr_cache
+from ocr import extract_text_from_pdf, OCR_DPI
+from ocr_backends import get_backend
+from jobs import summarize_timings
+from preprocessing import resolve_pipeline
+
+def peak_rss_mb():
+    """ Peak resident memory of this process and its finished children (tesseract runs). """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(own / divisor, 1), round(children / divisor, 1)
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+def edit_distance(a, b):
+    """ Levenshtein distance with a single row of the DP table. """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        previous = current
+    return previous[-1]
+
+def character_error_rate(pages, ground_truth):
+    """ Errors / ground-truth characters over all pages. Page by page so the
+    quadratic edit distance stays cheap; a single ground-truth page is
+    compared with the whole document. """
+    truth_pages = ground_truth.split("\f")
+    if len(truth_pages) == 1:
+        hypotheses = [" ".join(page["text"] for page in pages)]
+    else:
+        hypotheses = [page["text"] for page in pages]
+        hypotheses += [""] * (len(truth_pages) - len(hypotheses))
+    errors = characters = 0
+    for truth, hypothesis in zip(truth_pages, hypotheses):
+        truth, hypothesis = normalize_text(truth), normalize_text(hypothesis)
+        errors += edit_distance(truth, hypothesis)
+        characters += len(truth)
+    return round(errors / max(1, characters), 4)
+
+def benchmark_document(pdf_path, args):
+    durations = []
+    result = None
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        result = extract_text_from_pdf(
+            pdf_path, args.lang, "benchmark", os.path.basename(pdf_path),
+            workers=args.workers, dpi=args.dpi, use_text_layer=args.use_text_layer,
+            preprocess=args.preprocess,
+        )
+        durations.append(time.perf_counter() - started)
+    if not result:
+        return {"file": os.path.basename(pdf_path), "error": "OCR failed"}
+
+    seconds = statistics.median(durations)
+    rss, children_rss = peak_rss_mb()
+    record = {
+        "file": os.path.basename(pdf_path),
+        "pages": result["page_count"],
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(result["page_count"] / seconds, 3) if seconds else None,
+        "peak_rss_mb": rss,
+        "peak_child_rss_mb": children_rss,
+        "page_status": {},
+        **summarize_timings(result),
+    }
+    for page in result["pages"]:
+        record["page_status"][page["status"]] = record["page_status"].get(page["status"], 0) + 1
+
+    if args.ground_truth:
+        truth_path = os.path.join(args.ground_truth, os.path.splitext(record["file"])[0] + ".txt")
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as f:
+                record["cer"] = character_error_rate(result["pages"], f.read())
+    return record
+
+def run_isolated(pdf_path, args):
+    """ benchmark_document in a new process, so ru_maxrss covers this document only. """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_disable_result_cache) as executor:
+        return executor.submit(benchmark_document, pdf_path, args).result()
+
+def _disable_result_cache():
+    # Every run must do the full OCR work
+    ocr_cache.OCR_RESULT_CACHE = False
+
+def compare(results, baseline, max_slowdown, max_cer_increase):
+    """ Regression messages for documents present in both runs. """
+    previous = {doc["file"]: doc for doc in baseline.get("documents", [])}
+    regressions = []
+    for doc in results["documents"]:
+        old = previous.get(doc["file"])
+        if not old or "error" in doc or "error" in old:
+            continue
+        if old.get("pages_per_sec") and doc.get("pages_per_sec") is not None:
+            change = (old["pages_per_sec"] - doc["pages_per_sec"]) / old["pages_per_sec"]
+            if change > max_slowdown:
+                regressions.append(
+                    f"{doc['file']}: {doc['pages_per_sec']} pages/sec vs {old['pages_per_sec']} in baseline "
+                    f"({change:.0%} slower)"
+                )
+        if "cer" in doc and "cer" in old and doc["cer"] - old["cer"] > max_cer_increase:
+            regressions.append(f"{doc['file']}: CER {doc['cer']} vs {old['cer']} in baseline")
+    if results["settings"] != baseline.get("settings"):
+        print("Warning: settings differ from the baseline run", file=sys.stderr)
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the OCR pipeline on sample PDFs")
+    parser.add_argument("pdfs", nargs="*", help="PDF files (default: uploads/*.pdf)")
+    parser.add_argument("--lang", default="auto")
+    parser.add_argument("--preprocess", default=None, help="preprocessing profile or step list (default: OCR_PREPROCESS)")
+    parser.add_argument("--workers", type=int, default=None, help="page workers (default: OCR_PAGE_WORKERS or one per core)")
+    parser.add_argument("--dpi", type=int, default=OCR_DPI)
+    parser.add_argument("--use-text-layer", action="store_true", help="skip OCR on pages with an embedded text layer")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per document; the median time is reported")
+    parser.add_argument("--ground-truth", default="benchmark_ground_truth", help="directory with <pdf name>.txt files")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    baseline = parser.add_mutually_exclusive_group()
+    baseline.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    baseline.add_argument("--no-baseline", action="store_true", help="do not compare with a baseline")
+    parser.add_argument("--max-slowdown", type=float, default=0.10, help="allowed pages/sec drop (fraction)")
+    parser.add_argument("--max-cer-increase", type=float, default=0.005, help="allowed absolute CER increase")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    args.repeat = max(1, args.repeat)
+    pdfs = args.pdfs or sorted(glob.glob(os.path.join("uploads", "*.pdf")))
+    if not pdfs:
+        sys.exit("No PDFs to benchmark")
+    if not (args.save_baseline or args.no_baseline or os.path.exists(args.baseline)):
+        # Checked before the run, so a missing baseline fails fast instead of passing silently
+        print(f"Baseline {args.baseline} not found: record one with --save-baseline "
+              "or pass --no-baseline", file=sys.stderr)
+        sys.exit(2)
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "backend": get_backend().name,
+        },
+        "settings": {
+            "lang": args.lang,
+            "preprocess": ",".join(resolve_pipeline(args.preprocess)),
+            "workers": args.workers,
+            "dpi": args.dpi,
+            "use_text_layer": args.use_text_layer,
+        },
+        "documents": [],
+    }
+    for pdf_path in pdfs:
+        record = run_isolated(pdf_path, args)
+        results["documents"].append(record)
+        summary = f"{record['file']}: " + (
+            record["error"] if "error" in record else
+            f"{record['pages']} pages, {record['pages_per_sec']} pages/sec, peak RSS {record['peak_rss_mb']} MB"
+            + (f", CER {record['cer']}" if "cer" in record else "")
+        )
+        print(summary)
+
+    timed = [doc for doc in results["documents"] if "error" not in doc]
+    total_seconds = sum(doc["seconds"] for doc in timed)
+    results["totals"] = {
+        "pages": sum(doc["pages"] for doc in timed),
+        "seconds": round(total_seconds, 3),
+        "pages_per_sec": round(sum(doc["pages"] for doc in timed) / total_seconds, 3) if total_seconds else None,
+        # Largest per-document peak; each document ran in its own process
+        "peak_rss_mb": max((doc["peak_rss_mb"] for doc in timed), default=None),
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    if args.no_baseline:
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.max_slowdown, args.max_cer_increase)
+    if regressions:
+        print("REGRESSIONS:", file=sys.stderr)
+        for message in regressions:
+            print(f"  {message}", file=sys.stderr)
+        sys.exit(1)
+    print(f"No regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
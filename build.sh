@@ -61,33 +61,9 @@ PILLOW_LIBS=$(find "$SITE_PACKAGES" -type d -iname "pillow.libs" | head -n 1)
 export LD_LIBRARY_PATH="${PYMUPDF_DIR:+$PYMUPDF_DIR:}${PILLOW_LIBS:+$PILLOW_LIBS:}$LD_LIBRARY_PATH"
 
 echo "📦 Step 4: Building dynamic executable with PyInstaller..."
-$PYINSTALLER --onefile \
-  --collect-all uvicorn \
-  --collect-all fastapi \
-  --collect-all starlette \
-  --collect-all docx \
-  --collect-all fitz \
-  --collect-all jose \
-  --collect-all tinydb \
-  --collect-all pdf2image \
-  --hidden-import "uvicorn.logging" \
-  --hidden-import "uvicorn.loops" \
-  --hidden-import "uvicorn.loops.auto" \
-  --hidden-import "uvicorn.protocols" \
-  --hidden-import "uvicorn.protocols.http.auto" \
-  --hidden-import "uvicorn.protocols.websockets.auto" \
-  --hidden-import "uvicorn.lifespan.on" \
-  --hidden-import "uvicorn.lifespan.off" \
-  --hidden-import "multipart" \
-  --hidden-import "python_multipart" \
-  --add-data "templates:templates" \
-  --add-data "static:static" \
-  --add-data "tessdata:tessdata" \
-  --add-binary "/usr/bin/tesseract:bin" \
-  --add-binary "/usr/bin/pdftoppm:bin" \
-  --add-binary "/usr/bin/pdftocairo:bin" \
-  --add-binary "/usr/bin/pdfinfo:bin" \
-  main.py
+# Bundled data, hidden imports and the slim tessdata are configured in main.spec;
+# language models other than English are written to dist/tessdata
+$PYINSTALLER --noconfirm main.spec
 
 echo "🛡️ Step 5: Compiling to fully static binary with StaticX..."
 $PYTHON -m staticx dist/main dist/DocuSearch_Backend
@@ -98,4 +74,5 @@ find "$SITE_PACKAGES" -type f -name "*.so.bak" \
   -exec bash -c 'mv "$1" "${1%.bak}"' _ {} \;
 echo "    Restore complete."
 
-echo "✅ Build Complete! Your portable app is at: dist/DocuSearch_Backend"
\ No newline at end of file
+echo "✅ Build Complete! Your portable app is at: dist/DocuSearch_Backend"
+echo "   Ship dist/tessdata next to it for languages other than English."
\ No newline at end of file
@@ -1,10 +1,24 @@
-from sqlalchemy import create_engine, Column, Integer, String
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, DateTime, Text, ForeignKey, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./sqlitedb.db")
 
-DATABASE_URL = "sqlite:///./sqlitedb.db"
+# Several processes (web workers, OCR workers) write to the same file; wait
+# for another writer's lock instead of failing after SQLite's default 5 s
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30})
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets the web server read while OCR workers write; foreign keys are off by default in SQLite
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -16,4 +30,88 @@ class User(Base):
     password = Column(String) # Hashed password
     refresh_token = Column(String, nullable=True)
 
-Base.metadata.create_all(bind=engine)
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    token_hash = Column(String, primary_key=True) # SHA-256 of the token
+    username = Column(String, index=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    doc_id = Column(String, index=True)
+    owner = Column(String, index=True)
+    source_file = Column(String)
+    pdf_path = Column(String)
+    language = Column(String, default="auto")
+    content_hash = Column(String, index=True, nullable=True) # SHA-256 of the uploaded PDF
+    options = Column(Text, nullable=True) # JSON encoded OCR options
+    status = Column(String, index=True, default="queued") # queued, running, completed, failed, cancelled
+    claimed_by = Column(String, nullable=True) # scheduler running the job
+    lease_expires_at = Column(DateTime, nullable=True) # others may reclaim the job after this
+    attempts = Column(Integer, nullable=True, default=0)
+    pages_done = Column(Integer, default=0)
+    page_count = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    stats = Column(Text, nullable=True) # JSON encoded per-stage timings
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class OcrDocument(Base):
+    __tablename__ = "documents"
+
+    id = Column(String, primary_key=True, index=True)
+    owner = Column(String, index=True, nullable=True)
+    source_file = Column(String)
+    content_hash = Column(String, index=True, nullable=True) # uploads/<content_hash>.pdf; legacy rows use source_file
+    language = Column(String)
+    page_count = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    pages = relationship("Page", order_by="Page.page_number", cascade="all, delete-orphan", passive_deletes=True)
+
+class Page(Base):
+    __tablename__ = "pages"
+    __table_args__ = (UniqueConstraint("doc_id", "page_number"),)
+
+    id = Column(Integer, primary_key=True)
+    doc_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    page_number = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False, default="")
+    status = Column(String) # success, ocr_failed, text_layer, edited
+
+class OcrPageCache(Base):
+    __tablename__ = "ocr_page_cache"
+
+    key = Column(String, primary_key=True) # SHA-256 of page image + language + preprocessing
+    text = Column(Text, nullable=False, default="")
+    status = Column(String)
+    words = Column(Text, nullable=True) # JSON word boxes, kept when a searchable PDF was requested
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+def _add_missing_columns(connection):
+    """ create_all does not alter existing tables; add nullable columns introduced later. """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+def _create_schema():
+    """ Create missing tables and columns. Processes started together
+    (uvicorn --workers) would race between checking for a table and creating
+    it, so the whole check-and-create runs under SQLite's write lock. """
+    with engine.connect() as connection:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        Base.metadata.create_all(bind=connection)
+        _add_missing_columns(connection)
+        connection.commit()
+
+_create_schema()
@@ -0,0 +1,181 @@
+from database import SessionLocal, OcrDocument, Page
+
+# ------------------------ DOCUMENT STORE ------------------------
+# OCR results live in the documents/pages tables. Records are returned as
+# plain dicts in the same shape the TinyDB store used, so callers and API
+# responses are unchanged.
+
+def document_to_dict(document, include_pages=True):
+    record = {
+        "id": document.id,
+        "source_file": document.source_file,
+        "content_hash": document.content_hash,
+        "language": document.language,
+        "page_count": document.page_count,
+        "owner": document.owner,
+    }
+    if include_pages:
+        record["pages"] = [
+            {"page_number": page.page_number, "text": page.text, "status": page.status}
+            for page in document.pages
+        ]
+    return record
+
+def save_document(result, owner=None):
+    """ Insert or replace an OCR result in a single transaction. """
+    session = SessionLocal()
+    try:
+        document = session.get(OcrDocument, result["id"])
+        if document is not None:
+            session.query(Page).filter(Page.doc_id == result["id"]).delete()
+        else:
+            document = OcrDocument(id=result["id"])
+            session.add(document)
+
+        document.owner = owner or result.get("owner") or document.owner
+        document.source_file = result["source_file"]
+        document.content_hash = result.get("content_hash") or document.content_hash
+        document.language = result.get("language")
+        document.page_count = result["page_count"]
+        session.add_all([
+            Page(
+                doc_id=result["id"],
+                page_number=page["page_number"],
+                text=page.get("text") or "",
+                status=page.get("status"),
+            )
+            for page in result["pages"]
+        ])
+        session.commit()
+    finally:
+        session.close()
+
+def store_result(result):
+    """ Persist a finished OCR job: a whole document, or the pages of a re-OCR. """
+    if result.get("partial"):
+        update_pages(result["id"], result["pages"])
+    else:
+        save_document(result)
+
+def get_document(doc_id, include_pages=True):
+    session = SessionLocal()
+    try:
+        document = session.get(OcrDocument, doc_id)
+        if document is None:
+            return None
+        return document_to_dict(document, include_pages)
+    finally:
+        session.close()
+
+def get_documents(doc_ids):
+    """ Metadata (no pages) for several documents, keyed by id. """
+    if not doc_ids:
+        return {}
+    session = SessionLocal()
+    try:
+        documents = session.query(OcrDocument).filter(OcrDocument.id.in_(list(doc_ids))).all()
+        return {document.id: document_to_dict(document, include_pages=False) for document in documents}
+    finally:
+        session.close()
+
+def list_documents(owner=None):
+    session = SessionLocal()
+    try:
+        query = session.query(OcrDocument)
+        if owner is not None:
+            query = query.filter(OcrDocument.owner == owner)
+        documents = query.order_by(OcrDocument.created_at).all()
+        return [document_to_dict(document, include_pages=False) for document in documents]
+    finally:
+        session.close()
+
+def document_exists(doc_id):
+    session = SessionLocal()
+    try:
+        return session.query(OcrDocument.id).filter(OcrDocument.id == doc_id).first() is not None
+    finally:
+        session.close()
+
+def count_documents():
+    session = SessionLocal()
+    try:
+        return session.query(OcrDocument).count()
+    finally:
+        session.close()
+
+def count_content_references(content_hash):
+    """ Number of documents backed by the upload with this content hash. """
+    session = SessionLocal()
+    try:
+        return session.query(OcrDocument).filter(OcrDocument.content_hash == content_hash).count()
+    finally:
+        session.close()
+
+def count_legacy_references(source_file):
+    """ Number of documents from before content hashing that use this upload file name. """
+    session = SessionLocal()
+    try:
+        return session.query(OcrDocument).filter(
+            OcrDocument.source_file == source_file, OcrDocument.content_hash.is_(None)
+        ).count()
+    finally:
+        session.close()
+
+def failed_page_numbers(pages):
+    """ Pages whose OCR produced nothing usable (ocr_image returned None). """
+    return [page["page_number"] for page in pages if page.get("status") == "ocr_failed"]
+
+def merge_region_text(text, region_text):
+    """ Add re-OCR'd region text to a page's text as its own paragraph,
+    unless the page already contains it. """
+    region_text = region_text.strip()
+    if not region_text or region_text in text:
+        return text
+    return f"{text.rstrip()}\n\n{region_text}" if text.strip() else region_text
+
+def update_pages(doc_id, pages):
+    """ Replace text and status of the given pages, leaving the rest of the
+    document alone. Pages whose OCR failed keep their stored text; pages
+    marked "merge" (a region re-OCR) add their text to the stored text. """
+    session = SessionLocal()
+    try:
+        for page in pages:
+            if page.get("status") == "ocr_failed":
+                continue
+            row = session.query(Page).filter(
+                Page.doc_id == doc_id, Page.page_number == page["page_number"]
+            ).first()
+            if row is None:
+                continue
+            text = page.get("text") or ""
+            if page.get("merge"):
+                row.text = merge_region_text(row.text or "", text)
+                row.status = "edited"
+            else:
+                row.text = text
+                row.status = page.get("status")
+        session.commit()
+    finally:
+        session.close()
+
+def update_page_text(doc_id, page_number, text, status="edited"):
+    """ Update a single page row. Returns False when the page does not exist. """
+    session = SessionLocal()
+    try:
+        updated = session.query(Page).filter(
+            Page.doc_id == doc_id, Page.page_number == page_number
+        ).update({"text": text, "status": status})
+        session.commit()
+        return updated > 0
+    finally:
+        session.close()
+
+def delete_document(doc_id):
+    session = SessionLocal()
+    try:
+        session.query(Page).filter(Page.doc_id == doc_id).delete()
+        deleted = session.query(OcrDocument).filter(OcrDocument.id == doc_id).delete()
+        session.commit()
+        return deleted > 0
+    finally:
+        session.close()
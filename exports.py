@@ -0,0 +1,132 @@
+import os
+import tempfile
+import zipfile
+
+import document_store
+from searchable_pdf import searchable_pdf_path
+
+# ------------------------ EXPORTS ------------------------
+# Documents are exported one at a time and written out in chunks, so memory
+# use does not grow with the size or number of exported documents.
+
+EXPORT_FORMATS = ("docx", "txt", "pdf")
+CHUNK_SIZE = 1024 * 1024
+# Generated DOCX files larger than this are spooled to a temporary file
+SPOOL_LIMIT = 8 * 1024 * 1024
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+def export_name(record, extension, prefix=""):
+    base = record["source_file"]
+    if base.lower().endswith(".pdf"):
+        base = base[:-4]
+    return f"{prefix}{base}.{extension}"
+
+def write_docx(record, out):
+    """ Write the document's page text as DOCX to a binary file object. """
+    # python-docx is only needed here; importing it lazily keeps startup fast
+    from docx import Document
+    from docx.shared import Pt
+
+    doc = Document()
+    style = doc.styles['Normal']
+    font = style.font
+    font.name = 'Noto Sans'
+    font.size = Pt(12)
+
+    for page_data in record["pages"]:
+        text = page_data["text"].replace('\r\n', '\n')
+        paragraphs = text.split('\n\n')  # Treat double newlines as paragraph breaks
+        for para in paragraphs:
+            paragraph = doc.add_paragraph()
+            lines = para.split('\n')  # Handle single line breaks
+            for i, line in enumerate(lines):
+                paragraph.add_run(line)
+                if i < len(lines) - 1:
+                    paragraph.add_run().add_break()
+    doc.save(out)
+
+def iter_docx(record):
+    """ DOCX bytes in chunks, spooled through a temporary file. """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT) as buffer:
+        write_docx(record, buffer)
+        buffer.seek(0)
+        while True:
+            chunk = buffer.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+def iter_txt(record):
+    for page in record["pages"]:
+        yield f"--- Page {page['page_number']} ---\n{page['text']}\n\n".encode("utf-8")
+
+def iter_file(path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+class _ZipOutput:
+    """ Write-only, non-seekable sink for ZipFile. zipfile then uses data
+    descriptors instead of seeking back, so the archive can be streamed. """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_zip(doc_ids, formats, pdf_path):
+    """ Stream a ZIP with one entry per document and format. `pdf_path(record)`
+    locates a document's original PDF, used for "pdf" when there is no
+    searchable PDF; documents that no longer exist are skipped. """
+    output = _ZipOutput()
+    names = set()
+    with zipfile.ZipFile(output, "w") as archive:
+        for doc_id in doc_ids:
+            record = document_store.get_document(doc_id)
+            if record is None:
+                continue
+            for fmt in formats:
+                if fmt == "docx":
+                    chunks, compression = iter_docx(record), zipfile.ZIP_STORED
+                elif fmt == "txt":
+                    chunks, compression = iter_txt(record), zipfile.ZIP_DEFLATED
+                else:
+                    path = searchable_pdf_path(record["id"])
+                    if not os.path.exists(path):
+                        path = pdf_path(record)
+                    if not os.path.exists(path):
+                        continue
+                    chunks, compression = iter_file(path), zipfile.ZIP_STORED
+
+                name = export_name(record, fmt)
+                if name in names:
+                    name = f"{record['id']}/{name}"
+                names.add(name)
+
+                info = zipfile.ZipInfo(name)
+                info.compress_type = compression
+                with archive.open(info, "w", force_zip64=True) as entry:
+                    for chunk in chunks:
+                        entry.write(chunk)
+                        yield output.drain()
+            yield output.drain()
+    yield output.drain()
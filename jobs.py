@@ -0,0 +1,505 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from datetime import datetime, timedelta
+import json
+import logging
+import multiprocessing
+import signal
+import socket
+import threading
+import time
+import uuid
+
+from sqlalchemy import or_, and_, func
+
+from database import SessionLocal, Job, engine
+import document_store
+from ocr import extract_text_from_pdf, reocr_pages, OCR_PAGE_WORKERS
+from searchable_pdf import build_searchable_pdf, searchable_pdf_path, discard_searchable_pdf
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ JOB QUEUE ------------------------
+# Jobs are rows in the shared jobs table. Any number of schedulers (web
+# processes with OCR_WORKER_MODE=embedded, or standalone `python jobs.py`
+# workers) claim queued rows with a compare-and-set UPDATE and hold them
+# under a lease that is renewed after every page. A job whose lease runs out
+# (its worker died) is claimed again by someone else, up to JOB_MAX_ATTEMPTS.
+
+# Number of OCR worker processes per scheduler, i.e. how many jobs it runs at
+# once. Each job runs in its own process so the web server's event loop
+# never waits on Tesseract.
+OCR_JOB_WORKERS = int(os.environ.get("OCR_JOB_WORKERS", "2"))
+
+# "embedded": the web process also runs jobs; "off": it only queues them
+# for standalone workers (python jobs.py)
+OCR_WORKER_MODE = os.environ.get("OCR_WORKER_MODE", "embedded")
+
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "300"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+# Admission control: new jobs are refused while this many are queued (0 = no limit)
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "100"))
+
+# Port for a standalone worker's own /metrics (0 = none)
+WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", "0"))
+
+# Unless OCR_PAGE_WORKERS is set, the cores are split evenly between jobs
+PAGE_WORKERS_PER_JOB = OCR_PAGE_WORKERS or max(1, (os.cpu_count() or 1) // OCR_JOB_WORKERS)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_pool = None
+_futures = {}
+_futures_lock = threading.Lock()
+_worker_id = None
+_dispatcher = None
+_wakeup = threading.Event()
+_stopping = threading.Event()
+
+class JobCancelled(Exception):
+    pass
+
+class LeaseLost(Exception):
+    """ Another scheduler took the job over after our lease expired. """
+
+class QueueFull(Exception):
+    pass
+
+# ------------------------ WORKER SIDE ------------------------
+
+def _init_worker():
+    # Never reuse a connection pool set up before the worker started
+    engine.dispose()
+    metrics.configure_logging()
+
+def lease_expiry():
+    return datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+
+def run_ocr_job(job_id, worker_id):
+    """ Runs inside a pool process. Returns the OCR result dict or None. """
+    session = SessionLocal()
+    try:
+        job = session.get(Job, job_id)
+        if job is None or job.status == "cancelled":
+            raise JobCancelled()
+        if job.claimed_by != worker_id:
+            raise LeaseLost()
+
+        job.started_at = datetime.utcnow()
+        job.pages_done = 0
+        session.commit()
+
+        def report(pages_done, page_count):
+            session.refresh(job)
+            if job.status == "cancelled":
+                raise JobCancelled()
+            if job.claimed_by != worker_id:
+                raise LeaseLost()
+            job.pages_done = pages_done
+            job.page_count = page_count
+            job.lease_expires_at = lease_expiry()
+            session.commit()
+
+        options = json.loads(job.options or "{}")
+        if options.get("pages"):
+            # Re-OCR of selected pages of an existing document
+            result = reocr_pages(
+                job.pdf_path, options["pages"], job.language, job.doc_id,
+                progress=report, workers=PAGE_WORKERS_PER_JOB,
+                preprocess=options.get("preprocess"), region=options.get("region"),
+                replace_page=options.get("replace_page", False)
+            )
+            job.stats = json.dumps(summarize_timings(result))
+            session.commit()
+            return result
+
+        result = extract_text_from_pdf(
+            job.pdf_path, job.language, job.doc_id, job.source_file,
+            progress=report, workers=PAGE_WORKERS_PER_JOB,
+            use_text_layer=options.get("use_text_layer", True),
+            preprocess=options.get("preprocess"),
+            keep_words=options.get("searchable_pdf", False)
+        )
+        if result and options.get("searchable_pdf"):
+            try:
+                build_searchable_pdf(job.pdf_path, result["pages"], searchable_pdf_path(job.doc_id))
+            except Exception as e:
+                # The OCR text is still good; only the PDF artifact is missing
+                logger.error("Building searchable PDF for job %s failed: %s", job_id, e)
+            for page in result["pages"]:
+                page.pop("words", None)
+                page.pop("image_size", None)
+        if result:
+            result["owner"] = job.owner
+            result["content_hash"] = job.content_hash
+            job.stats = json.dumps(summarize_timings(result))
+            session.commit()
+        return result
+    finally:
+        session.close()
+
+def summarize_timings(result):
+    """ Total milliseconds per pipeline stage and per preprocessing step. """
+    cached_pages = 0
+    stages = dict(result.get("timings", {}))
+    preprocess = {}
+    for page in result["pages"]:
+        if page.get("cached"):
+            cached_pages += 1
+        for name, value in page.get("timings", {}).items():
+            if name == "preprocess":
+                for step, ms in value.items():
+                    preprocess[step] = round(preprocess.get(step, 0.0) + ms, 2)
+            else:
+                stages[name] = round(stages.get(name, 0.0) + value, 2)
+    return {"stages_ms": stages, "preprocess_ms": preprocess, "cached_pages": cached_pages}
+
+# ------------------------ SERVER SIDE ------------------------
+
+def job_to_dict(job):
+    percent = None
+    if job.page_count:
+        percent = round(100.0 * job.pages_done / job.page_count, 1)
+    return {
+        "job_id": job.id,
+        "doc_id": job.doc_id,
+        "source_file": job.source_file,
+        "language": job.language,
+        "options": json.loads(job.options or "{}"),
+        "status": job.status,
+        "progress": {"pages_done": job.pages_done or 0, "page_count": job.page_count, "percent": percent},
+        "error": job.error,
+        "stats": json.loads(job.stats) if job.stats else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+def _holds_claim(job_id):
+    session = SessionLocal()
+    try:
+        job = session.get(Job, job_id)
+        return job is not None and job.claimed_by == _worker_id and job.status == "running"
+    finally:
+        session.close()
+
+def _finish_job(job_id, status, error=None):
+    session = SessionLocal()
+    try:
+        job = session.get(Job, job_id)
+        if job is None:
+            return
+        # A cancel request that arrived while the last page was running wins
+        if job.status == "cancelled":
+            status = "cancelled"
+        job.status = status
+        job.error = error
+        job.lease_expires_at = None
+        job.finished_at = datetime.utcnow()
+        session.commit()
+        metrics.OCR_JOBS.labels(status=status).inc()
+        if status != "completed":
+            _release_job_upload(job)
+    finally:
+        session.close()
+
+def _release_job_upload(job):
+    """ A new upload whose OCR never produced a document is removed again,
+    unless another document or job uses the same file. """
+    if job.content_hash and not json.loads(job.options or "{}").get("pages"):
+        release_upload(job.pdf_path, job.content_hash)
+
+def _job_done(job_id, future):
+    with _futures_lock:
+        _futures.pop(job_id, None)
+    # A slot is free again
+    _wakeup.set()
+
+    try:
+        result = future.result()
+    except LeaseLost:
+        logger.warning("OCR job %s was taken over by another worker", job_id)
+        return
+    except (CancelledError, JobCancelled):
+        _finish_job(job_id, "cancelled")
+        return
+    except Exception as e:
+        logger.error("OCR job %s failed: %s", job_id, e)
+        _finish_job(job_id, "failed", error=str(e))
+        return
+
+    if not result:
+        _finish_job(job_id, "failed", error="OCR failed")
+        return
+
+    if not _holds_claim(job_id):
+        # Cancelled meanwhile, or our lease expired and the job moved on
+        if _job_status(job_id) == "cancelled":
+            _finish_job(job_id, "cancelled")
+        return
+
+    # A re-OCR leaves pages it could not read untouched (see document_store.update_pages)
+    failed_pages = document_store.failed_page_numbers(result["pages"]) if result.get("partial") else []
+    if failed_pages and len(failed_pages) == len(result["pages"]):
+        _finish_job(job_id, "failed", error=f"OCR failed for pages {format_pages(failed_pages)}; stored text left unchanged")
+        return
+
+    try:
+        started = time.perf_counter()
+        document_store.store_result(result)
+        metrics.observe_stage("db_write", time.perf_counter() - started)
+        if result.get("partial"):
+            # Its text layer still holds the pages as they were before
+            discard_searchable_pdf(result["id"])
+    except Exception as e:
+        logger.error("Storing OCR result for job %s failed: %s", job_id, e)
+        _finish_job(job_id, "failed", error=str(e))
+        return
+    metrics.observe_ocr_result(result)
+    error = f"OCR failed for pages {format_pages(failed_pages)}; their text was left unchanged" if failed_pages else None
+    _finish_job(job_id, "completed", error=error)
+    logger.info("OCR job %s completed: pages=%d", job_id, result["page_count"])
+
+def format_pages(page_numbers):
+    return ", ".join(str(number) for number in page_numbers)
+
+def _job_status(job_id):
+    session = SessionLocal()
+    try:
+        job = session.get(Job, job_id)
+        return job.status if job else None
+    finally:
+        session.close()
+
+def _claimable(now):
+    # NULL leases are running rows left behind by versions without leases
+    return or_(
+        Job.status == "queued",
+        and_(Job.status == "running", or_(Job.lease_expires_at < now, Job.lease_expires_at.is_(None))),
+    )
+
+def claim_next_job(worker_id):
+    """ Atomically take the oldest claimable job. Returns its id or None. """
+    session = SessionLocal()
+    try:
+        while True:
+            now = datetime.utcnow()
+            candidates = [row.id for row in session.query(Job.id).filter(_claimable(now))
+                          .order_by(Job.created_at).limit(5)]
+            if not candidates:
+                return None
+            for job_id in candidates:
+                # Compare-and-set: only one scheduler's UPDATE matches the row
+                claimed = session.query(Job).filter(Job.id == job_id, _claimable(now)).update({
+                    "status": "running",
+                    "claimed_by": worker_id,
+                    "lease_expires_at": lease_expiry(),
+                    "attempts": func.coalesce(Job.attempts, 0) + 1,
+                }, synchronize_session=False)
+                session.commit()
+                if not claimed:
+                    continue
+                job = session.get(Job, job_id)
+                if job.attempts > JOB_MAX_ATTEMPTS:
+                    job.status = "failed"
+                    job.error = f"Gave up after {JOB_MAX_ATTEMPTS} attempts"
+                    job.lease_expires_at = None
+                    job.finished_at = datetime.utcnow()
+                    session.commit()
+                    logger.error("OCR job %s failed: %s", job_id, job.error)
+                    _release_job_upload(job)
+                    continue
+                return job_id
+    finally:
+        session.close()
+
+def release_claimed_jobs(worker_id):
+    """ Put this scheduler's running jobs back in the queue (graceful shutdown). """
+    session = SessionLocal()
+    try:
+        released = session.query(Job).filter(Job.claimed_by == worker_id, Job.status == "running").update({
+            "status": "queued",
+            "claimed_by": None,
+            "lease_expires_at": None,
+            "attempts": func.max(func.coalesce(Job.attempts, 1) - 1, 0),
+        }, synchronize_session=False)
+        session.commit()
+        return released
+    finally:
+        session.close()
+
+def _free_slots():
+    with _futures_lock:
+        return OCR_JOB_WORKERS - len(_futures)
+
+def _dispatch_loop():
+    while not _stopping.is_set():
+        try:
+            while _free_slots() > 0:
+                job_id = claim_next_job(_worker_id)
+                if job_id is None:
+                    break
+                logger.info("Claimed OCR job %s", job_id)
+                _submit(job_id)
+        except Exception as e:
+            logger.error("Claiming OCR jobs failed: %s", e)
+        _wakeup.wait(JOB_POLL_SECONDS)
+        _wakeup.clear()
+
+def _submit(job_id):
+    future = _pool.submit(run_ocr_job, job_id, _worker_id)
+    with _futures_lock:
+        _futures[job_id] = future
+    future.add_done_callback(lambda f: _job_done(job_id, f))
+
+def start():
+    """ Start this process's worker pool and the thread that claims jobs for it. """
+    global _pool, _worker_id, _dispatcher
+    _worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    _stopping.clear()
+    # Spawned, not forked: forking copies the dispatcher thread's locks and
+    # the web server's open connections into every job process
+    _pool = ProcessPoolExecutor(max_workers=OCR_JOB_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=_init_worker)
+    _dispatcher = threading.Thread(target=_dispatch_loop, name="ocr-dispatcher", daemon=True)
+    _dispatcher.start()
+    logger.info("OCR scheduler %s started with %d job slots", _worker_id, OCR_JOB_WORKERS)
+
+def shutdown():
+    """ Stop claiming, stop the pool and hand unfinished jobs back to the queue. """
+    if _pool is None:
+        return
+    _stopping.set()
+    _wakeup.set()
+    _dispatcher.join(timeout=JOB_POLL_SECONDS + 5)
+    _pool.shutdown(wait=False, cancel_futures=True)
+    released = release_claimed_jobs(_worker_id)
+    if released:
+        logger.info("Returned %d unfinished OCR jobs to the queue", released)
+
+def count_queued_jobs():
+    session = SessionLocal()
+    try:
+        return session.query(Job).filter(Job.status == "queued").count()
+    finally:
+        session.close()
+
+def check_admission():
+    """ Raise QueueFull when the shared queue is at MAX_QUEUED_JOBS. """
+    if MAX_QUEUED_JOBS and count_queued_jobs() >= MAX_QUEUED_JOBS:
+        raise QueueFull()
+
+def submit_ocr_job(doc_id, pdf_path, source_file, language, owner, options=None, content_hash=None):
+    """ Queue a job; whichever scheduler has a free slot picks it up. """
+    job_id = str(uuid.uuid4())
+    session = SessionLocal()
+    try:
+        job = Job(
+            id=job_id,
+            doc_id=doc_id,
+            owner=owner,
+            source_file=source_file,
+            pdf_path=pdf_path,
+            language=language,
+            content_hash=content_hash,
+            options=json.dumps(options or {}),
+            status="queued",
+            pages_done=0,
+            attempts=0,
+        )
+        session.add(job)
+        session.commit()
+        job_data = job_to_dict(job)
+    finally:
+        session.close()
+
+    # Let the local scheduler (if any) claim it without waiting for the next poll
+    _wakeup.set()
+    return job_data
+
+def has_active_jobs(content_hash):
+    """ True while a queued or running job still needs the upload with this hash. """
+    session = SessionLocal()
+    try:
+        return session.query(Job.id).filter(
+            Job.content_hash == content_hash, Job.status.in_(ACTIVE_STATUSES)
+        ).first() is not None
+    finally:
+        session.close()
+
+def release_upload(pdf_path, content_hash=None, source_file=None):
+    """ Remove an upload once no document or active job references it.
+    Documents from before content hashing share their file by name. """
+    if content_hash:
+        if document_store.count_content_references(content_hash) or has_active_jobs(content_hash):
+            return
+    elif document_store.count_legacy_references(source_file):
+        return
+    if os.path.exists(pdf_path):
+        os.remove(pdf_path)
+
+def get_job(job_id, owner=None):
+    session = SessionLocal()
+    try:
+        job = session.get(Job, job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job_to_dict(job)
+    finally:
+        session.close()
+
+def list_jobs(owner):
+    session = SessionLocal()
+    try:
+        jobs = session.query(Job).filter(Job.owner == owner).order_by(Job.created_at.desc()).all()
+        return [job_to_dict(job) for job in jobs]
+    finally:
+        session.close()
+
+def cancel_job(job_id, owner=None):
+    """ Cancel a queued or running job. Running jobs stop after their current page. """
+    session = SessionLocal()
+    try:
+        job = session.get(Job, job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        was_queued = job.status == "queued"
+        if job.status in ACTIVE_STATUSES:
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+            session.commit()
+        if was_queued:
+            # A running job releases its upload when its worker stops (_finish_job)
+            _release_job_upload(job)
+        job_data = job_to_dict(job)
+    finally:
+        session.close()
+
+    with _futures_lock:
+        future = _futures.get(job_id)
+    if future is not None:
+        future.cancel()
+    return job_data
+
+def run_worker():
+    """ Standalone scheduler: claims and runs jobs until SIGTERM/SIGINT. """
+    metrics.configure_logging()
+    if WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+        start_http_server(WORKER_METRICS_PORT, registry=metrics.metrics_registry())
+
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+
+    start()
+    stop.wait()
+    shutdown()
+
+if __name__ == "__main__":
+    # Go through the importable module so pool processes can unpickle run_ocr_job
+    import jobs
+    jobs.run_worker()
@@ -1,35 +1,48 @@
+import time
+
+# Start of the startup-time report (see metrics.report_startup)
+STARTUP_STARTED = time.perf_counter()
+
 import os
-import sys
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Form, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, HTMLResponse, Response, FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security.oauth2 import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 
-from pdf2image import convert_from_path
-from PIL import Image
-import pytesseract
-from pytesseract import Output
-import re
 import uuid
-from tinydb import TinyDB, Query
-import fitz  # PyMuPDF
+import re
+import logging
+import binascii
+import aiofiles
 import base64
 from typing import Optional
 import hashlib
-from jose import jwt, JWTError
-from datetime import datetime, timedelta
-from docx import Document
-from docx.shared import Pt
-from io import BytesIO
-
-def resource_path(relative_path):
-    """ Get absolute path to resource, works for dev and for PyInstaller """
-    if hasattr(sys, '_MEIPASS'):
-        return os.path.join(sys._MEIPASS, relative_path)
-    return os.path.join(os.path.abspath("."), relative_path)
+import math
+from urllib.parse import quote
+from python_multipart import MultipartParser
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import parse_options_header
+
+# Heavy libraries (PyMuPDF, pdf2image, Tesseract bindings, python-docx,
+# python-jose) are imported by these modules on first use, not here.
+from ocr import resource_path, refresh_languages, available_languages
+import jobs
+import search_index
+import page_cache
+import document_store
+import migrate_ocr_results
+import preprocessing
+from searchable_pdf import searchable_pdf_path, discard_searchable_pdf
+from exports import EXPORT_FORMATS, DOCX_MEDIA_TYPE, export_name, iter_docx, iter_zip
+import metrics
+import auth
+
+metrics.configure_logging()
+logger = logging.getLogger(__name__)
+metrics.record_startup_phase("imports", time.perf_counter() - STARTUP_STARTED)
 
 app = FastAPI()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -40,20 +53,6 @@ if os.path.isdir(static_dir) and os.listdir(static_dir):
     app.mount("/static", StaticFiles(directory=static_dir), name="static")
 templates = Jinja2Templates(directory=resource_path("templates"))
 
-# --- EXTERNAL BINARY CONFIG ---
-# We will tell PyInstaller to put all executables in a "bin" folder
-pytesseract.pytesseract.tesseract_cmd = resource_path("bin/tesseract") 
-os.environ['TESSDATA_PREFIX'] = resource_path("tessdata")
-
-# Critical for pdf2image: It needs to know where the poppler binaries are
-poppler_path = resource_path("bin")
-
-# JWT settings
-SECRET_KEY = "your-secret-key"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-REFRESH_TOKEN_EXPIRE_DAYS = 7
-
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -63,299 +62,418 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-db = TinyDB("ocr_results.json")
-user_db = TinyDB("users.json")
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# ------------------------ AUTH UTILS ------------------------
-
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "200"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+MAX_EXPORT_DOCUMENTS = int(os.environ.get("MAX_EXPORT_DOCUMENTS", "500"))
+RETRY_AFTER_SECONDS = 30
+
+TRUE_VALUES = {"1", "true", "t", "yes", "y", "on"}
+FALSE_VALUES = {"0", "false", "f", "no", "n", "off"}
+
+# /upload/ parses its own body, so describe the form for the API docs
+UPLOAD_REQUEST_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["file"],
+    "properties": {
+        "file": {"type": "string", "format": "binary"},
+        "lang": {"type": "string", "default": "auto"},
+        "text_layer": {"type": "boolean", "default": True},
+        "preprocess": {"type": "string"},
+        "searchable_pdf": {"type": "boolean", "default": False},
+    },
+}}}}}
+
+# uvicorn worker processes when started with `python main.py`
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "1"))
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-
-def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-
-def verify_token(token: str, credentials_exception):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        return username
-    except JWTError:
-        raise credentials_exception
+# ------------------------ AUTH UTILS ------------------------
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def credentials_exception():
+    return HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    return verify_token(token, credentials_exception)
-
-# ------------------------ OCR LOGIC ------------------------
-
-SCRIPT_LANG_MAP = {
-    'Latin': 'eng',
-    'Meetei_Mayek': 'mni',
-    'Devanagari': 'hin',
-    'Bengali': 'ben',
-
-}
-
-COMMON_ENG_WORDS = {
-    "the", "be", "to", "of", "and", "a", "in", "that", "have", "i", "it", "for", "not", "on", "with", "he", "as", "you", "do", "at",
-    "this", "but", "his", "by", "from", "they", "we", "say", "her", "she", "or", "an", "will", "my", "one", "all", "would", "there",
-    "their", "what", "so", "up", "out", "if", "about", "who", "get", "which", "go", "me", "when", "make", "can", "like", "time",
-    "no", "just", "him", "know", "take", "people", "into", "year", "your", "good", "some", "could", "them", "see", "other", "than",
-    "then", "now", "look", "only", "come", "its", "over", "think", "also", "back", "after", "use", "two", "how", "our", "work",
-    "first", "well", "way", "even", "new", "want", "because", "any", "these", "give", "day", "most", "us", "writ", "petition",
-    "civil", "no", "of", "court", "judgment", "order", "case", "versus", "union", "india", "state", "manipur", "respondents",
-    "petitioner", "advocate", "counsel", "honble", "justice", "mr", "mrs", "shri", "smt", "disclaimer", "vernacular", "meant", 
-    "restricted", "litigant", "understand", "language", "purpose", "practical", "official", "original", "version", "authentic", 
-    "field", "execution", "implementation", "high", "imphal"
-}
-
-def pdf_to_images(pdf_path):
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
-        return convert_from_path(pdf_path, poppler_path=poppler_path)
-    except Exception as e:
-        raise RuntimeError(f"Failed to convert PDF: {e}")
+        return auth.verify_access_token(token)
+    except auth.InvalidToken:
+        raise credentials_exception()
 
-def preprocess_image(image):
-    image = image.convert('L')
-    image = image.point(lambda x: 0 if x < 128 else 255, '1')
-    return image
+# ------------------------ API ROUTES ------------------------
 
-def detect_script(image) -> str:
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
     try:
-        osd = pytesseract.image_to_osd(image)
-        for line in osd.splitlines():
-            if "Script" in line:
-                return line.split(":")[-1].strip()
-    except Exception:
-        pass
-    return "Latin"  # Default fallback
-
-def ocr_image(image, lang):
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/document/{doc_id}/...) so ids do not explode the series count
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            method=request.method, route=getattr(route, "path", "unmatched"), status=str(status)
+        ).observe(time.perf_counter() - started)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.on_event("startup")
+def migrate_legacy_results():
+    # First start after the move off TinyDB: import the old ocr_results.json
+    with metrics.startup_phase("migrate_results"):
+        if document_store.count_documents() == 0 and os.path.exists("ocr_results.json"):
+            migrated, _ = migrate_ocr_results.migrate("ocr_results.json")
+            logger.info("Migrated %d documents from ocr_results.json", migrated)
+
+@app.on_event("startup")
+def migrate_legacy_users():
+    # Merge accounts from the old TinyDB users.json; migrate_users skips
+    # usernames that already exist, so this is safe on every start
+    with metrics.startup_phase("migrate_users"):
+        if os.path.exists("users.json"):
+            migrated = auth.migrate_users("users.json")
+            if migrated:
+                logger.info("Migrated %d users from users.json", migrated)
+        auth.purge_expired_refresh_tokens()
+
+@app.on_event("startup")
+def build_search_index():
+    with metrics.startup_phase("search_index"):
+        search_index.init_index()
+
+# Tesseract languages are discovered on first use (see ocr.available_languages)
+
+@app.on_event("startup")
+def start_ocr_workers():
+    # With OCR_WORKER_MODE=off this process only queues jobs for standalone workers
+    if jobs.OCR_WORKER_MODE == "embedded":
+        with metrics.startup_phase("ocr_workers"):
+            jobs.start()
+
+@app.on_event("startup")
+def report_startup():
+    # Registered last, so it runs after the other startup steps
+    metrics.report_startup(STARTUP_STARTED)
+
+@app.on_event("shutdown")
+def stop_ocr_workers():
+    jobs.shutdown()
+
+def admit_job():
+    """ Refuse new OCR work while the shared queue is full. """
     try:
-        available_languages = set(pytesseract.get_languages())
-        print(f"Available languages: {available_languages}")
-        
-        if lang == "auto":
-            script = detect_script(image)
-            lang = SCRIPT_LANG_MAP.get(script, "eng")
-            
-        # Filter requested languages
-        requested_langs = lang.split('+')
-        valid_langs = [l for l in requested_langs if l in available_languages]
-        
-        print(valid_langs)
-        
-        if not valid_langs:
-            print(f"Warning: No valid languages found in request '{lang}'. Falling back to 'eng' (if available) or first available.")
-            if 'eng' in available_languages:
-                final_lang = 'eng'
-            elif available_languages:
-                final_lang = list(available_languages)[0]
-            else:
-                return None # No languages available at all
+        jobs.check_admission()
+    except jobs.QueueFull:
+        raise HTTPException(status_code=503, detail="OCR queue is full, try again later",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+def upload_too_large():
+    return HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_MB} MB upload limit")
+
+def upload_path(content_hash):
+    return os.path.join(UPLOAD_DIR, f"{content_hash}.pdf")
+
+def document_pdf_path(record):
+    """ Uploads are stored by content hash; documents from before that use their file name. """
+    if record.get("content_hash"):
+        return upload_path(record["content_hash"])
+    return os.path.join(UPLOAD_DIR, record["source_file"])
+
+async def write_chunks(chunks):
+    """ Store an async iterable of byte chunks under its SHA-256 without
+    holding the file in memory. Identical uploads share one file. Returns
+    (content_hash, pdf_path). """
+    tmp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise upload_too_large()
+                digest.update(chunk)
+                await out.write(chunk)
+        content_hash = digest.hexdigest()
+        pdf_path = upload_path(content_hash)
+        if os.path.exists(pdf_path):
+            os.remove(tmp_path)
         else:
-            final_lang = "+".join(valid_langs)
-            
-        print(f"Performing OCR with language(s): {final_lang}")
-
-        # HYBRID LOGIC for mixed content (specifically mni+eng)
-        # Dictionary-based line switching
-        if 'mni' in valid_langs and 'eng' in valid_langs:
-             print("Using Hybrid Line-Based Dictionary OCR for mixed content...")
-             
-             # 1. Layout analysis with 'eng' to find lines
-             data = pytesseract.image_to_data(image, lang='eng', output_type=Output.DICT)
-             
-             if 'text' not in data:
-                 return pytesseract.image_to_string(image, lang=final_lang)
-
-             n_boxes = len(data['text'])
-             lines = {}
-             
-             # Group by line
-             for i in range(n_boxes):
-                 if int(data['conf'][i]) == -1: continue
-                 
-                 # Key: (block, par, line)
-                 key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
-                 
-                 if key not in lines:
-                     lines[key] = {
-                         'text': [],
-                         'left': [], 'top': [], 'width': [], 'height': []
-                     }
-                 
-                 lines[key]['text'].append(data['text'][i])
-                 lines[key]['left'].append(data['left'][i])
-                 lines[key]['top'].append(data['top'][i])
-                 lines[key]['width'].append(data['width'][i])
-                 lines[key]['height'].append(data['height'][i])
-
-             sorted_keys = sorted(lines.keys())
-             final_text = ""
-             
-             for key in sorted_keys:
-                 l_data = lines[key]
-                 line_text_eng = " ".join(l_data['text']).strip()
-                 
-                 if not line_text_eng: continue
-                 
-                 # Check English Score
-                 tokens = [re.sub(r'[^a-zA-Z]', '', t).lower() for t in line_text_eng.split()]
-                 tokens = [t for t in tokens if t]
-                 
-                 is_eng = False
-                 if tokens:
-                     match_count = sum(1 for t in tokens if t in COMMON_ENG_WORDS)
-                     score = match_count / len(tokens)
-                     if score >= 0.2: # Threshold
-                         is_eng = True
-                 
-                 if is_eng:
-                     final_text += line_text_eng + "\n"
-                 else:
-                     # Re-OCR line with MNI
-                     x_min = min(l_data['left'])
-                     y_min = min(l_data['top'])
-                     x_max = max([l+w for l, w in zip(l_data['left'], l_data['width'])])
-                     y_max = max([t+h for t, h in zip(l_data['top'], l_data['height'])])
-                     
-                     padding = 5
-                     crop = image.crop((
-                         max(0, x_min - padding),
-                         max(0, y_min - padding),
-                         min(image.width, x_max + padding),
-                         min(image.height, y_max + padding)
-                     ))
-                     
-                     mni_text = pytesseract.image_to_string(crop, lang='mni').strip()
-                     final_text += mni_text + "\n"
-                     
-             return final_text
-
-        return pytesseract.image_to_string(image, lang=final_lang)
-    except Exception as e:
-        print(f"OCR Error: {e}")
-        return None
-
-def extract_text_from_pdf(pdf_path, language, doc_id, original_filename):
-    images = pdf_to_images(pdf_path)
-    if not images:
-        return None
-
-    result = {
-        "id": doc_id,
-        "source_file": original_filename,
-        "language": language,
-        "page_count": len(images),
-        "pages": []
-    }
-
-    for i, image in enumerate(images):
-        page_number = i + 1
-        processed = preprocess_image(image)
-        text = ocr_image(processed, lang=language or "auto")
-        print("TEXT:", text)
-        result["pages"].append({
-            "page_number": page_number,
-            "text": text if text else "",
-            "status": "success" if text else "ocr_failed"
-        })
-
-    return result
-
-# ------------------------ API ROUTES ------------------------
+            os.replace(tmp_path, pdf_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return content_hash, pdf_path
+
+def ocr_options(text_layer, preprocess, searchable_pdf):
+    if preprocess:
+        try:
+            preprocessing.resolve_pipeline(preprocess)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return {"use_text_layer": text_layer, "preprocess": preprocess, "searchable_pdf": searchable_pdf}
+
+def form_bool(name, value, default):
+    """ Parse a boolean form field the way FastAPI's Form(bool) does. """
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise HTTPException(status_code=422, detail=f"{name} must be a boolean")
+
+async def iter_multipart(request: Request):
+    """ Parse a multipart/form-data body as it arrives. Yields ("part",
+    name, filename) when a part starts, then ("data", bytes) for its
+    content and ("end",) when it is complete. """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    events = []
+    headers = {}
+    header = [b"", b""]
+
+    def on_header_end():
+        headers[header[0].lower()] = header[1]
+        header[:] = [b"", b""]
+
+    def on_headers_finished():
+        _, options = parse_options_header(headers.pop(b"content-disposition", b""))
+        headers.clear()
+        if b"name" not in options:
+            raise HTTPException(status_code=400, detail="Multipart part without a name")
+        filename = options[b"filename"].decode("utf-8", "replace") if b"filename" in options else None
+        events.append(("part", options[b"name"].decode("utf-8", "replace"), filename))
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": lambda data, start, end: header.__setitem__(0, header[0] + data[start:end]),
+        "on_header_value": lambda data, start, end: header.__setitem__(1, header[1] + data[start:end]),
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": lambda data, start, end: events.append(("data", bytes(data[start:end]))),
+        "on_part_end": lambda: events.append(("end",)),
+    })
+    received = 0
+    try:
+        async for chunk in request.stream():
+            # Form fields are small, so the whole body gets the file's limit
+            received += len(chunk)
+            if received > MAX_UPLOAD_BYTES + CHUNK_SIZE:
+                raise upload_too_large()
+            parser.write(chunk)
+            for event in events:
+                yield event
+            events.clear()
+        parser.finalize()
+    except FormParserError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid multipart body: {e}")
+    for event in events:
+        yield event
+
+async def iter_part(parts):
+    """ The content of the current part of an iter_multipart stream. """
+    async for event in parts:
+        if event[0] == "end":
+            return
+        yield event[1]
+
+async def iter_base64(b64_string: str):
+    # 4 base64 characters decode to 3 bytes, so decode in multiples of 4
+    b64_string = "".join(b64_string.split())
+    step = (CHUNK_SIZE // 3) * 4
+    for start in range(0, len(b64_string), step):
+        try:
+            yield base64.b64decode(b64_string[start:start + step], validate=True)
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid base64 string")
+
+@app.post("/upload/", status_code=202, openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_pdf(request: Request, current_user: str = Depends(get_current_user)):
+    # The body is streamed into the upload store as it arrives rather than
+    # spooled by FastAPI first, so oversized uploads are refused up front
+    if int(request.headers.get("content-length") or 0) > MAX_UPLOAD_BYTES + CHUNK_SIZE:
+        raise upload_too_large()
+    admit_job()
+
+    fields = {}
+    upload = None
+    parts = iter_multipart(request)
+    try:
+        async for event in parts:
+            if event[0] != "part":
+                continue
+            _, name, filename = event
+            if name == "file" and filename is not None and upload is None:
+                if not filename.endswith(".pdf"):
+                    raise HTTPException(status_code=400, detail="File must be a PDF")
+                upload = (os.path.basename(filename),) + await write_chunks(iter_part(parts))
+            else:
+                value = bytearray()
+                async for data in iter_part(parts):
+                    value += data
+                fields[name] = value.decode("utf-8", "replace")
+        if upload is None:
+            raise HTTPException(status_code=422, detail="file is required")
+        options = ocr_options(form_bool("text_layer", fields.get("text_layer"), True),
+                              fields.get("preprocess") or None,
+                              form_bool("searchable_pdf", fields.get("searchable_pdf"), False))
+    except BaseException:
+        if upload is not None:
+            jobs.release_upload(upload[2], upload[1])
+        raise
+
+    filename, content_hash, pdf_path = upload
+    doc_id = str(uuid.uuid4())
+    job = jobs.submit_ocr_job(doc_id, pdf_path, filename, fields.get("lang") or "auto", current_user,
+                              options=options, content_hash=content_hash)
+    return {"message": "OCR queued", "id": doc_id, "job_id": job["job_id"], "status": job["status"]}
 
-@app.post("/upload/")
-async def upload_pdf(file: UploadFile = File(...), lang: str = Form("auto"), current_user: str = Depends(get_current_user)):
-    if not file.filename.endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="File must be a PDF")
+@app.post("/upload_base64/", status_code=202)
+async def upload_base64_pdf(b64_string: str = Form(...), filename: Optional[str] = Form("base64_upload.pdf"), lang: str = Form("auto"), text_layer: bool = Form(True), preprocess: Optional[str] = Form(None), searchable_pdf: bool = Form(False), current_user: str = Depends(get_current_user)):
+    if len(b64_string) * 3 // 4 > MAX_UPLOAD_BYTES:
+        raise upload_too_large()
+    options = ocr_options(text_layer, preprocess, searchable_pdf)
+    admit_job()
 
-    pdf_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(pdf_path, "wb") as f:
-        f.write(await file.read())
+    filename = os.path.basename(filename)
+    content_hash, pdf_path = await write_chunks(iter_base64(b64_string))
 
     doc_id = str(uuid.uuid4())
-    result = extract_text_from_pdf(pdf_path, lang, doc_id, file.filename)
-    if result:
-        db.insert(result)
-        return {"message": "OCR completed", "id": doc_id, "page_count": result["page_count"]}
-    else:
-        raise HTTPException(status_code=500, detail="OCR failed")
-
-@app.post("/upload_base64/")
-async def upload_base64_pdf(b64_string: str = Form(...), filename: Optional[str] = Form("base64_upload.pdf"), lang: str = Form("auto"), current_user: str = Depends(get_current_user)):
+    job = jobs.submit_ocr_job(doc_id, pdf_path, filename, lang, current_user, options=options,
+                              content_hash=content_hash)
+    return {"message": "OCR queued", "id": doc_id, "job_id": job["job_id"], "status": job["status"]}
+
+@app.get("/languages/")
+def list_languages(current_user: str = Depends(get_current_user)):
+    return {"languages": sorted(available_languages())}
+
+@app.post("/languages/refresh")
+def refresh_ocr_languages(current_user: str = Depends(get_current_user)):
+    return {"languages": sorted(refresh_languages())}
+
+@app.get("/jobs/")
+def list_ocr_jobs(current_user: str = Depends(get_current_user)):
+    return JSONResponse(content=jobs.list_jobs(current_user))
+
+@app.get("/jobs/{job_id}")
+def get_ocr_job(job_id: str, current_user: str = Depends(get_current_user)):
+    job = jobs.get_job(job_id, owner=current_user)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_ocr_job(job_id: str, current_user: str = Depends(get_current_user)):
+    job = jobs.cancel_job(job_id, owner=current_user)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def encode_cursor(after) -> str:
+    """ Opaque search cursor for the (rank, page id) of the last hit returned. """
+    rank, page_id = after
+    return base64.urlsafe_b64encode(f"k:{rank!r}:{page_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
     try:
-        pdf_data = base64.b64decode(b64_string)
+        kind, rank, page_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        rank = float(rank)
+        if kind != "k" or not math.isfinite(rank):
+            raise ValueError
+        return rank, int(page_id)
     except Exception:
-        raise HTTPException(status_code=400, detail="Invalid base64 string")
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    pdf_path = os.path.join(UPLOAD_DIR, filename)
-    with open(pdf_path, "wb") as f:
-        f.write(pdf_data)
+def search_hits(query: str, limit: int, cursor: Optional[str]):
+    """ Lightweight page-level hits: no page text and no images. Clients fetch
+    /document/{id}/page_image/{n} only for the hits they display. """
+    after = decode_cursor(cursor) if cursor else None
+    total, hits, next_after = search_index.search_pages(query, limit=limit, after=after)
 
-    doc_id = str(uuid.uuid4())
-    result = extract_text_from_pdf(pdf_path, lang, doc_id, filename)
-    if result:
-        db.insert(result)
-        return {"message": "OCR completed", "id": doc_id, "page_count": result["page_count"]}
-    else:
-        raise HTTPException(status_code=500, detail="OCR failed")
+    documents = document_store.get_documents({hit["doc_id"] for hit in hits})
+    results = []
+    for hit in hits:
+        record = documents.get(hit["doc_id"])
+        if not record:
+            continue
+        results.append({
+            **hit,
+            "source_file": record["source_file"],
+            "page_count": record["page_count"],
+            "page_image_url": f"/document/{hit['doc_id']}/page_image/{hit['page_number']}",
+        })
+
+    return {
+        "query": query,
+        "total": total,
+        "hits": results,
+        "next_cursor": encode_cursor(next_after) if next_after else None,
+    }
 
 @app.get("/search/")
-def search_text(query: str, current_user: str = Depends(get_current_user)):
+def search_text(query: str, mode: str = "full", limit: int = 20, offset: int = 0, cursor: Optional[str] = None,
+                current_user: str = Depends(get_current_user)):
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    if mode == "hits":
+        return JSONResponse(content=search_hits(query, limit, cursor))
+    if mode != "full":
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'hits'")
+
+    total, hits = search_index.search(query, limit=limit, offset=offset)
+
+    documents = document_store.get_documents({hit["id"] for hit in hits})
     results = []
-    for record in db:
+    for hit in hits:
+        record = documents.get(hit["id"])
+        if not record:
+            continue
+
         matched_pages = []
-        for page in record["pages"]:
-            if query.lower() in page["text"].lower():
-                try:
-                    pdf_path = os.path.join(UPLOAD_DIR, record["source_file"])
-                    doc = fitz.open(pdf_path)
-                    page_pix = doc.load_page(page["page_number"] - 1).get_pixmap()
-                    img_bytes = page_pix.pil_tobytes(format="PNG")
-                    encoded_image = base64.b64encode(img_bytes).decode("utf-8")
-                except Exception:
-                    encoded_image = None
-
-                matched_pages.append({
-                    "page_number": page["page_number"],
-                    "text": page["text"],
-                    "page_image_base64": encoded_image,
-                    "image_format": "image/png"
-                })
-
-        if matched_pages:
-            results.append({
-                "id": record["id"],
-                "source_file": record["source_file"],
-                "page_count": record["page_count"],
-                "matches": matched_pages
+        for page in hit["matches"]:
+            try:
+                pdf_path = document_pdf_path(record)
+                img_bytes, _ = page_cache.get_page_image(record["id"], pdf_path, page["page_number"])
+                encoded_image = base64.b64encode(img_bytes).decode("utf-8")
+            except Exception:
+                encoded_image = None
+
+            matched_pages.append({
+                "page_number": page["page_number"],
+                "text": page["text"],
+                "score": page["score"],
+                "page_image_base64": encoded_image,
+                "image_format": "image/png"
             })
 
-    return JSONResponse(content=results)
+        results.append({
+            "id": record["id"],
+            "source_file": record["source_file"],
+            "page_count": record["page_count"],
+            "score": hit["score"],
+            "matches": matched_pages
+        })
+
+    return JSONResponse(content=results, headers={"X-Total-Count": str(total)})
 
 @app.get("/documents/")
-def list_documents(current_user: str = Depends(get_current_user)):
+def list_documents(mine: bool = False, current_user: str = Depends(get_current_user)):
     documents = []
-    for record in db.all(): # Use TinyDB for OCR results
+    for record in document_store.list_documents(owner=current_user if mine else None):
         documents.append({
             "id": record["id"],
             "source_file": record["source_file"],
@@ -364,160 +482,278 @@ def list_documents(current_user: str = Depends(get_current_user)):
     return JSONResponse(content=documents)
 
 @app.get("/document/{doc_id}")
-def get_document(doc_id: str, current_user: str = Depends(get_current_user)):
-    result = db.get(Query().id == doc_id)
+def get_document(doc_id: str, include_pdf: bool = False, current_user: str = Depends(get_current_user)):
+    result = document_store.get_document(doc_id)
     if result:
-        pdf_path = os.path.join(UPLOAD_DIR, result["source_file"])
-        if os.path.exists(pdf_path):
+        result["pdf_url"] = f"/document/{doc_id}/pdf"
+        if os.path.exists(searchable_pdf_path(doc_id)):
+            result["searchable_pdf_url"] = f"/document/{doc_id}/searchable_pdf"
+        pdf_path = document_pdf_path(result)
+        # Inlining the PDF is kept for older clients; new clients use pdf_url
+        if include_pdf and os.path.exists(pdf_path):
             with open(pdf_path, "rb") as f:
                 encoded_pdf = base64.b64encode(f.read()).decode("utf-8")
             result["full_pdf_base64"] = encoded_pdf
         return result
     raise HTTPException(status_code=404, detail="Document not found")
 
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+async def iter_file_range(path, start, length):
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def pdf_file_response(pdf_path, filename, request: Request):
+    """ A PDF as binary. A single `Range: bytes=a-b` request is answered
+    with 206 so viewers can fetch only the parts they need. """
+    if not os.path.exists(pdf_path):
+        raise HTTPException(status_code=404, detail="PDF file not found")
+
+    file_size = os.path.getsize(pdf_path)
+    range_header = request.headers.get("range")
+    if not range_header:
+        return FileResponse(pdf_path, media_type="application/pdf", filename=filename,
+                            headers={"Accept-Ranges": "bytes"})
+
+    match = RANGE_RE.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{file_size}"})
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), file_size - 1) if last else file_size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(0, file_size - int(last))
+        end = file_size - 1
+    if start > end or start >= file_size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{file_size}"})
+
+    length = end - start + 1
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Content-Length": str(length),
+    }
+    return StreamingResponse(iter_file_range(pdf_path, start, length), status_code=206,
+                             media_type="application/pdf", headers=headers)
+
+@app.get("/document/{doc_id}/pdf")
+def download_document_pdf(doc_id: str, request: Request, current_user: str = Depends(get_current_user)):
+    """ The original PDF (supports Range requests). """
+    record = document_store.get_document(doc_id, include_pages=False)
+    if not record:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return pdf_file_response(document_pdf_path(record), record["source_file"], request)
+
+@app.get("/document/{doc_id}/searchable_pdf")
+def download_searchable_pdf(doc_id: str, request: Request, current_user: str = Depends(get_current_user)):
+    """ The PDF with an invisible OCR text layer, for documents uploaded with searchable_pdf=true. """
+    record = document_store.get_document(doc_id, include_pages=False)
+    if not record:
+        raise HTTPException(status_code=404, detail="Document not found")
+    path = searchable_pdf_path(doc_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No searchable PDF for this document")
+    return pdf_file_response(path, export_name(record, "pdf", prefix="searchable_"), request)
+
+def content_disposition(filename):
+    # RFC 5987 encoding so non-ASCII (e.g. Bengali) file names survive the latin-1 header
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
 @app.get("/document/{doc_id}/edited_docx")
-async def get_edited_docx(doc_id: str, current_user: str = Depends(get_current_user)):
-    record = db.get(Query().id == doc_id) # Use TinyDB for OCR results
+def get_edited_docx(doc_id: str, current_user: str = Depends(get_current_user)):
+    record = document_store.get_document(doc_id)
     if not record:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    # Create a DOCX document
-    doc = Document()
-    style = doc.styles['Normal']
-    font = style.font
-    font.name = 'Noto Sans'
-    font.size = Pt(12)
-
-    for page_data in record["pages"]:
-        text = page_data["text"].replace('\r\n', '\n')
-        paragraphs = text.split('\n\n')  # Treat double newlines as paragraph breaks
-        for para in paragraphs:
-            paragraph = doc.add_paragraph()
-            lines = para.split('\n')  # Handle single line breaks
-            for i, line in enumerate(lines):
-                paragraph.add_run(line)
-                if i < len(lines) - 1:
-                    paragraph.add_run().add_break()
-
-    # Save to a BytesIO stream
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-
-    # Encode to base64
-    encoded_docx = base64.b64encode(buffer.read()).decode("utf-8")
-    return JSONResponse(content={
-        "edited_docx_base64": encoded_docx,
-        "filename": f"edited_{record['source_file'].replace('.pdf', '.docx')}"
-    })
+    filename = export_name(record, "docx", prefix="edited_")
+    return StreamingResponse(iter_docx(record), media_type=DOCX_MEDIA_TYPE,
+                             headers={"Content-Disposition": content_disposition(filename)})
+
+@app.post("/export/")
+def export_documents(doc_ids: Optional[str] = Form(None), query: Optional[str] = Form(None), formats: str = Form("docx"),
+                     current_user: str = Depends(get_current_user)):
+    """ Stream a ZIP with the given formats (docx, txt, pdf) for a comma
+    separated list of document ids and/or the documents matching a search query. """
+    formats = [fmt.strip() for fmt in formats.split(",") if fmt.strip()]
+    if not formats or any(fmt not in EXPORT_FORMATS for fmt in formats):
+        raise HTTPException(status_code=400, detail=f"formats must be a comma separated list of: {', '.join(EXPORT_FORMATS)}")
+
+    ids = [doc_id.strip() for doc_id in (doc_ids or "").split(",") if doc_id.strip()]
+    if query:
+        ids += search_index.matching_document_ids(query, limit=MAX_EXPORT_DOCUMENTS)
+    ids = list(dict.fromkeys(ids))[:MAX_EXPORT_DOCUMENTS]
+    if not ids:
+        raise HTTPException(status_code=400, detail="Provide doc_ids or a query matching at least one document")
+
+    return StreamingResponse(iter_zip(ids, formats, document_pdf_path), media_type="application/zip",
+                             headers={"Content-Disposition": 'attachment; filename="export.zip"'})
 
 @app.get("/document/{doc_id}/page_image/{page_number}")
-def get_document_page_image(doc_id: str, page_number: int, current_user: str = Depends(get_current_user)):
-    record = db.get(Query().id == doc_id)
+def get_document_page_image(doc_id: str, page_number: int, request: Request, scale: float = 1.0, format: str = "png",
+                            size: str = "full", current_user: str = Depends(get_current_user)):
+    if format not in page_cache.IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(page_cache.IMAGE_FORMATS)}")
+    if size not in ("full", "thumbnail"):
+        raise HTTPException(status_code=400, detail="size must be 'full' or 'thumbnail'")
+    if not (0.1 <= scale <= 4.0):
+        raise HTTPException(status_code=400, detail="scale must be between 0.1 and 4.0")
+
+    record = document_store.get_document(doc_id, include_pages=False)
     if not record:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    pdf_path = os.path.join(UPLOAD_DIR, record["source_file"])
+    pdf_path = document_pdf_path(record)
     if not os.path.exists(pdf_path):
         raise HTTPException(status_code=404, detail="PDF file not found")
 
     try:
-        doc = fitz.open(pdf_path)
-        if not (0 < page_number <= doc.page_count):
-            raise HTTPException(status_code=400, detail="Page number out of range")
-
-        page = doc.load_page(page_number - 1)
-        pix = page.get_pixmap()
-        img_bytes = pix.pil_tobytes(format="PNG")
-        encoded_image = base64.b64encode(img_bytes).decode("utf-8")
-        return JSONResponse(content={"page_image_base64": encoded_image, "image_format": "image/png"})
-
+        img_bytes, etag = page_cache.get_page_image(
+            doc_id, pdf_path, page_number, scale=scale, fmt=format, thumbnail=(size == "thumbnail")
+        )
+    except IndexError:
+        raise HTTPException(status_code=400, detail="Page number out of range")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing PDF page: {e}")
 
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=img_bytes, media_type=page_cache.IMAGE_FORMATS[format], headers=headers)
+
 @app.put("/edit/")
 def edit_page_text(doc_id: str = Form(...), page_number: int = Form(...), new_text: str = Form(...), current_user: str = Depends(get_current_user)):
-    Document = Query()
-    document = db.get(Document.id == doc_id)
-    if not document:
+    if not document_store.document_exists(doc_id):
         raise HTTPException(status_code=404, detail="Document not found")
 
-    updated = False
-    for page in document["pages"]:
-        if page["page_number"] == page_number:
-            page["text"] = new_text
-            page["status"] = "edited"
-            updated = True
-            break
-
-    if not updated:
+    if not document_store.update_page_text(doc_id, page_number, new_text):
         raise HTTPException(status_code=404, detail="Page not found in document")
+    # Its text layer would still hold the old text
+    discard_searchable_pdf(doc_id)
 
-    db.update(document, Document.id == doc_id)
     return {"message": "Text updated", "doc_id": doc_id, "page_number": page_number}
 
+def parse_page_numbers(pages: str, page_count: int):
+    """ "1,3,5-7" -> [1, 3, 5, 6, 7]; every page must exist in the document. """
+    numbers = set()
+    for part in pages.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            raise HTTPException(status_code=400, detail="pages must look like '1,3,5-7'")
+        # Check bounds before expanding, so a huge range cannot exhaust memory
+        if first > last:
+            raise HTTPException(status_code=400, detail=f"Page range {part} is reversed")
+        if first < 1 or last > page_count:
+            raise HTTPException(status_code=400, detail=f"Pages must be between 1 and {page_count}")
+        numbers.update(range(first, last + 1))
+    if not numbers:
+        raise HTTPException(status_code=400, detail="No pages selected")
+    return sorted(numbers)
+
+def parse_region(region: str):
+    """ "x0,y0,x1,y1" as fractions (0-1) of the page width and height. """
+    try:
+        x0, y0, x1, y1 = (float(value) for value in region.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="region must be 'x0,y0,x1,y1' as fractions of the page size")
+    if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+        raise HTTPException(status_code=400, detail="region must satisfy 0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1")
+    return [x0, y0, x1, y1]
+
+@app.post("/document/{doc_id}/reocr", status_code=202)
+def reocr_document_pages(doc_id: str, pages: str = Form(...), lang: Optional[str] = Form(None),
+                         preprocess: Optional[str] = Form(None), region: Optional[str] = Form(None),
+                         replace_page: bool = Form(False), current_user: str = Depends(get_current_user)):
+    """ Queue OCR of selected pages (e.g. "2,5-7"), optionally of one region
+    of a single page, with another language or preprocessing. Only those
+    pages' text is replaced. Region text is added to the page's existing
+    text unless replace_page is set, in which case it replaces the page. """
+    record = document_store.get_document(doc_id, include_pages=False)
+    if not record:
+        raise HTTPException(status_code=404, detail="Document not found")
+    pdf_path = document_pdf_path(record)
+    if not os.path.exists(pdf_path):
+        raise HTTPException(status_code=404, detail="PDF file not found")
+
+    page_numbers = parse_page_numbers(pages, record["page_count"])
+    options = ocr_options(False, preprocess, False)
+    admit_job()
+    options["pages"] = page_numbers
+    if region:
+        if len(page_numbers) != 1:
+            raise HTTPException(status_code=400, detail="A region applies to exactly one page")
+        options["region"] = parse_region(region)
+        options["replace_page"] = replace_page
+
+    job = jobs.submit_ocr_job(doc_id, pdf_path, record["source_file"], lang or record["language"] or "auto",
+                              current_user, options=options, content_hash=record.get("content_hash"))
+    return {"message": "Re-OCR queued", "id": doc_id, "job_id": job["job_id"], "status": job["status"]}
+
 @app.delete("/document/{doc_id}")
 def delete_document(doc_id: str, current_user: str = Depends(get_current_user)):
     try:
         # Find the document
-        Document = Query()
-        document_list = db.search(Document.id == doc_id)
+        document = document_store.get_document(doc_id, include_pages=False)
         
-        if not document_list:
+        if not document:
             raise HTTPException(status_code=404, detail="Document not found")
-            
-        document = document_list[0]
         
-        # Delete the file
-        pdf_path = os.path.join(UPLOAD_DIR, document["source_file"])
-        if os.path.exists(pdf_path):
-            os.remove(pdf_path)
-            
-        # Delete from database
-        db.remove(Document.id == doc_id)
+        # Delete from database, then the file if no other document shares it
+        document_store.delete_document(doc_id)
+        page_cache.invalidate_document(doc_id)
+        jobs.release_upload(document_pdf_path(document), document.get("content_hash"), document["source_file"])
+        discard_searchable_pdf(doc_id)
         
         return {"message": "Document deleted successfully", "id": doc_id}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
 
 @app.post("/login/")
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    User = Query()
-    hashed_password = hash_password(form_data.password)
-    user = user_db.get((User.username == form_data.username) & (User.password == hashed_password))
-    if not user:
+def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    if not auth.authenticate(form_data.username, form_data.password):
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
-    access_token = create_access_token(data={"sub": form_data.username})
-    refresh_token = create_refresh_token(data={"sub": form_data.username})
-    user_db.update({"refresh_token": refresh_token}, User.username == form_data.username)
+    access_token = auth.create_access_token(data={"sub": form_data.username})
+    refresh_token = auth.issue_refresh_token(form_data.username)
 
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 @app.post("/refresh/")
-async def refresh_token(refresh_token: str = Form(...)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    refreshed_username = verify_token(refresh_token, credentials_exception)
-
-    User = Query()
-    user = user_db.get(User.username == refreshed_username)
-    if not user or user.get("refresh_token") != refresh_token:
+def refresh_token(refresh_token: str = Form(...)):
+    try:
+        refreshed_username = auth.check_refresh_token(refresh_token)
+    except auth.InvalidToken:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-    new_access_token = create_access_token(data={"sub": refreshed_username})
+    new_access_token = auth.create_access_token(data={"sub": refreshed_username})
     return {"access_token": new_access_token, "token_type": "bearer"}
 
+@app.post("/logout/")
+def logout(refresh_token: str = Form(...)):
+    """ Revoke a refresh token. Access tokens stay valid until they expire. """
+    auth.revoke_refresh_token(refresh_token)
+    return {"message": "Logged out"}
+
 @app.post("/register/")
 def register(username: str = Form(...), password: str = Form(...)):
-    User = Query()
-    if user_db.get(User.username == username):
+    if not auth.create_user(username, auth.hash_password(password)):
         raise HTTPException(status_code=400, detail="Username already exists")
-    user_db.insert({"username": username, "password": hash_password(password)})
     return {"message": "User registered", "username": username}
 
 
@@ -541,4 +777,8 @@ async def dashboard_page(request: Request):
 if __name__ == "__main__":
     import multiprocessing
     multiprocessing.freeze_support()  # Required for Windows PyInstaller
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False)
\ No newline at end of file
+    if WEB_WORKERS > 1 and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Worker processes inherit this, so /metrics covers all of them
+        import tempfile
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="docusearch-metrics-")
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False, workers=WEB_WORKERS)
\ No newline at end of file
@@ -1,7 +1,19 @@
 # -*- mode: python ; coding: utf-8 -*-
+import glob
+import os
+import shutil
+
 from PyInstaller.utils.hooks import collect_all
 
-datas = [('templates', 'templates'), ('static', 'static'), ('tessdata', 'tessdata')]
+# A onefile build unpacks everything bundled on every launch, so only the
+# English model goes inside the executable. The other language models are
+# copied to dist/tessdata, next to it, and linked in on first use
+# (see OCR_MODEL_DIRS in ocr.py).
+BUNDLED_MODELS = ['eng']
+
+datas = [('templates', 'templates'), ('static', 'static'),
+         ('tessdata/configs', 'tessdata/configs'), ('tessdata/tessconfigs', 'tessdata/tessconfigs')]
+datas += [(f'tessdata/{lang}.traineddata', 'tessdata') for lang in BUNDLED_MODELS]
 binaries = [('/usr/bin/tesseract', 'bin'), ('/usr/bin/pdftoppm', 'bin'), ('/usr/bin/pdftocairo', 'bin'), ('/usr/bin/pdfinfo', 'bin')]
 hiddenimports = ['uvicorn.logging', 'uvicorn.loops', 'uvicorn.loops.auto', 'uvicorn.protocols', 'uvicorn.protocols.http.auto', 'uvicorn.protocols.websockets.auto', 'uvicorn.lifespan.on', 'uvicorn.lifespan.off', 'multipart', 'python_multipart']
 tmp_ret = collect_all('uvicorn')
@@ -16,8 +28,6 @@ tmp_ret = collect_all('fitz')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 tmp_ret = collect_all('jose')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
-tmp_ret = collect_all('tinydb')
-datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 tmp_ret = collect_all('pdf2image')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 
@@ -31,7 +41,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter'],
     noarchive=False,
     optimize=0,
 )
@@ -57,3 +67,9 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+
+model_dir = os.path.join(DISTPATH, 'tessdata')
+os.makedirs(model_dir, exist_ok=True)
+for path in glob.glob(os.path.join('tessdata', '*.traineddata')):
+    if os.path.basename(path)[:-len('.traineddata')] not in BUNDLED_MODELS:
+        shutil.copy2(path, model_dir)
@@ -0,0 +1,127 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess,
+)
+
+logger = logging.getLogger(__name__)
+
+# ------------------------ LOGGING ------------------------
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s"
+
+def configure_logging():
+    """ Called in the web process and in every OCR worker process. """
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+
+# ------------------------ METRICS ------------------------
+# OCR runs in worker processes, so stage timings are measured there and
+# carried back on the OCR result ("timings" on the document and on each
+# page, in milliseconds). The web process records them into the histograms
+# when a job finishes, which keeps every series in the one process that
+# serves /metrics.
+#
+# With several web processes (WEB_WORKERS > 1) each one would only report
+# its own samples. PROMETHEUS_MULTIPROC_DIR, an empty directory shared by
+# those processes, switches prometheus_client to multiprocess mode: every
+# process writes its samples there and /metrics aggregates all of them.
+# `python main.py` and the Docker image set it up when WEB_WORKERS > 1.
+
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+OCR_STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+OCR_STAGE_SECONDS = Histogram(
+    "ocr_stage_seconds", "Time spent per OCR pipeline stage (per page, per document for script_detection)",
+    ["stage"], buckets=OCR_STAGE_BUCKETS,
+)
+OCR_PAGES = Counter("ocr_pages_total", "Pages processed, by result status", ["status"])
+OCR_JOBS = Counter("ocr_jobs_total", "Finished OCR jobs, by final status", ["status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "HTTP request latency", ["method", "route", "status"],
+)
+
+_current = threading.local()
+
+@contextmanager
+def collect_stages():
+    """ Collect stage() timings made on this thread into the yielded dict (ms). """
+    timings = {}
+    previous = getattr(_current, "timings", None)
+    _current.timings = timings
+    try:
+        yield timings
+    finally:
+        _current.timings = previous
+
+@contextmanager
+def stage(name):
+    """ Time a block and add it to the timings being collected on this thread. """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = getattr(_current, "timings", None)
+        if timings is not None:
+            elapsed = (time.perf_counter() - started) * 1000
+            timings[name] = round(timings.get(name, 0.0) + elapsed, 2)
+
+def observe_stage(name, seconds):
+    OCR_STAGE_SECONDS.labels(stage=name).observe(seconds)
+
+def observe_ocr_result(result):
+    """ Record the timings an OCR worker attached to a finished result. """
+    for name, ms in result.get("timings", {}).items():
+        observe_stage(name, ms / 1000)
+    for page in result["pages"]:
+        OCR_PAGES.labels(status="cached" if page.get("cached") else page.get("status") or "unknown").inc()
+        for name, value in page.get("timings", {}).items():
+            if name == "preprocess":
+                value = sum(value.values())
+            observe_stage(name, value / 1000)
+
+# ------------------------ STARTUP ------------------------
+# Time from the start of main.py to a ready server, split into module imports
+# and each startup step. Logged once when startup completes and exported as
+# app_startup_seconds{phase} (phase="total" for the whole).
+
+# In multiprocess mode the slowest web process is reported
+STARTUP_SECONDS = Gauge("app_startup_seconds", "Time spent per startup phase", ["phase"], multiprocess_mode="max")
+
+_startup_phases = {}
+
+def record_startup_phase(name, seconds):
+    _startup_phases[name] = seconds
+    STARTUP_SECONDS.labels(phase=name).set(seconds)
+
+@contextmanager
+def startup_phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_startup_phase(name, time.perf_counter() - started)
+
+def report_startup(started):
+    """ Log the startup phases and the total since `started` (a perf_counter() value). """
+    total = time.perf_counter() - started
+    STARTUP_SECONDS.labels(phase="total").set(total)
+    phases = " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in _startup_phases.items())
+    logger.info("Startup finished in %.0f ms: %s", total * 1000, phases)
+
+def metrics_registry():
+    """ Registry to export: this process's, or all processes' in multiprocess mode. """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def render_metrics():
+    """ (body, content type) for the /metrics endpoint. """
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
@@ -0,0 +1,46 @@
+""" One-shot migration of a TinyDB ocr_results.json into the SQLite document store.
+
+Usage: python migrate_ocr_results.py [path/to/ocr_results.json]
+
+Documents already present in the database are skipped, so the migration can
+be re-run safely. The JSON file is left untouched.
+"""
+import json
+import os
+import sys
+
+from sqlalchemy.exc import IntegrityError
+
+import document_store
+
+def load_tinydb_records(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    # TinyDB layout: {"_default": {"1": {...}, "2": {...}}}
+    for table in data.values():
+        for record in table.values():
+            yield record
+
+def migrate(path="ocr_results.json"):
+    migrated = skipped = 0
+    for record in load_tinydb_records(path):
+        if not record.get("id") or document_store.document_exists(record["id"]):
+            skipped += 1
+            continue
+        record.setdefault("pages", [])
+        record.setdefault("page_count", len(record["pages"]))
+        try:
+            document_store.save_document(record)
+        except IntegrityError:
+            # Another process starting at the same time imported it
+            skipped += 1
+            continue
+        migrated += 1
+    return migrated, skipped
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "ocr_results.json"
+    if not os.path.exists(path):
+        sys.exit(f"{path} not found")
+    migrated, skipped = migrate(path)
+    print(f"Migrated {migrated} documents, skipped {skipped}")
@@ -0,0 +1,762 @@
+import os
+import sys
+import re
+import shutil
+import logging
+import threading
+import time
+import unicodedata
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# PyMuPDF, pdf2image and the Tesseract bindings are imported where they are
+# used, so importing this module (and starting the web server) stays cheap.
+import ocr_backends
+from ocr_backends import get_backend
+from preprocessing import run_pipeline, resolve_pipeline, to_source_box
+import ocr_cache
+from metrics import collect_stages, stage
+
+logger = logging.getLogger(__name__)
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.join(sys._MEIPASS, relative_path)
+    return os.path.join(os.path.abspath("."), relative_path)
+
+# --- EXTERNAL BINARY CONFIG ---
+# We will tell PyInstaller to put all executables in a "bin" folder
+ocr_backends.TESSERACT_CMD = resource_path("bin/tesseract")
+os.environ['TESSDATA_PREFIX'] = resource_path("tessdata")
+
+# Critical for pdf2image: It needs to know where the poppler binaries are
+poppler_path = resource_path("bin")
+
+# Pages are OCR'd in parallel, one Tesseract process each, so every process
+# gets a single OpenMP thread instead of fighting over all cores.
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# Number of pages OCR'd concurrently per document (0 = one per CPU core)
+OCR_PAGE_WORKERS = int(os.environ.get("OCR_PAGE_WORKERS", "0"))
+
+# Resolution pages are rasterized at before OCR (pdf2image's default was 200)
+OCR_DPI = int(os.environ.get("OCR_DPI", "200"))
+
+# Minimum non-whitespace characters for an embedded text layer to be trusted
+TEXT_LAYER_MIN_CHARS = int(os.environ.get("TEXT_LAYER_MIN_CHARS", "50"))
+
+# With lang="auto", OSD runs on this many sample pages and the winning script
+# is used for the whole document. Below the confidence threshold every page
+# is detected on its own instead.
+SCRIPT_SAMPLE_PAGES = int(os.environ.get("SCRIPT_SAMPLE_PAGES", "3"))
+SCRIPT_MIN_CONFIDENCE = float(os.environ.get("SCRIPT_MIN_CONFIDENCE", "1.0"))
+
+# ------------------------ OCR LOGIC ------------------------
+
+SCRIPT_LANG_MAP = {
+    'Latin': 'eng',
+    'Meetei_Mayek': 'mni',
+    'Devanagari': 'hin',
+    'Bengali': 'ben',
+
+}
+
+COMMON_ENG_WORDS = {
+    "the", "be", "to", "of", "and", "a", "in", "that", "have", "i", "it", "for", "not", "on", "with", "he", "as", "you", "do", "at",
+    "this", "but", "his", "by", "from", "they", "we", "say", "her", "she", "or", "an", "will", "my", "one", "all", "would", "there",
+    "their", "what", "so", "up", "out", "if", "about", "who", "get", "which", "go", "me", "when", "make", "can", "like", "time",
+    "no", "just", "him", "know", "take", "people", "into", "year", "your", "good", "some", "could", "them", "see", "other", "than",
+    "then", "now", "look", "only", "come", "its", "over", "think", "also", "back", "after", "use", "two", "how", "our", "work",
+    "first", "well", "way", "even", "new", "want", "because", "any", "these", "give", "day", "most", "us", "writ", "petition",
+    "civil", "no", "of", "court", "judgment", "order", "case", "versus", "union", "india", "state", "manipur", "respondents",
+    "petitioner", "advocate", "counsel", "honble", "justice", "mr", "mrs", "shri", "smt", "disclaimer", "vernacular", "meant", 
+    "restricted", "litigant", "understand", "language", "purpose", "practical", "official", "original", "version", "authentic", 
+    "field", "execution", "implementation", "high", "imphal"
+}
+
+SCRIPT_RANGES = {
+    'Latin': [(0x0041, 0x007A), (0x00C0, 0x024F)],
+    'Meetei_Mayek': [(0xAAE0, 0xAAFF), (0xABC0, 0xABFF)],
+    'Devanagari': [(0x0900, 0x097F)],
+    'Bengali': [(0x0980, 0x09FF)],
+}
+
+def dominant_script(text):
+    """ Script with the most letters in `text`, by Unicode block. """
+    counts = {}
+    for c in text:
+        if not c.isalpha():
+            continue
+        code = ord(c)
+        for script, ranges in SCRIPT_RANGES.items():
+            if any(lo <= code <= hi for lo, hi in ranges):
+                counts[script] = counts.get(script, 0) + 1
+                break
+    if not counts:
+        return None
+    return max(counts, key=counts.get)
+
+# Share of a text layer's characters that must be plain ASCII, General
+# Punctuation or letters of a supported script block, and share of Latin
+# letters that must be ASCII. Legacy non-Unicode Indic fonts extract as
+# Latin-1/Extended letters and math symbols ("øÚ¬ı±¬ı˛Ì"), which fail both.
+TEXT_LAYER_MIN_CLEAN = 0.95
+TEXT_LAYER_MIN_ASCII_LATIN = 0.9
+
+def _is_clean_char(c):
+    code = ord(c)
+    if code < 0x80 or 0x2000 <= code <= 0x206F:
+        return True
+    return any(lo <= code <= hi for script, ranges in SCRIPT_RANGES.items() if script != 'Latin'
+               for lo, hi in ranges)
+
+def usable_text_layer(text, language):
+    """ Decide whether a page's embedded text is good enough to skip OCR.
+    Rejects near-empty layers, layers full of replacement/private-use glyphs
+    or stray symbols, and layers without a clearly dominant supported script
+    (legacy non-Unicode Meetei Mayek and Bengali fonts extract as Latin
+    gibberish). With a specific language the script must also match it. """
+    chars = "".join(text.split())
+    if len(chars) < TEXT_LAYER_MIN_CHARS:
+        return False
+
+    bad = sum(1 for c in chars if c == '\ufffd' or unicodedata.category(c) in ('Co', 'Cn', 'Cc'))
+    if bad / len(chars) > 0.05:
+        return False
+
+    if sum(1 for c in chars if _is_clean_char(c)) / len(chars) < TEXT_LAYER_MIN_CLEAN:
+        return False
+
+    script = dominant_script(chars)
+    if script is None:
+        return False
+    if script == 'Latin':
+        latin = [c for c in chars if c.isalpha() and ord(c) <= 0x024F]
+        if sum(1 for c in latin if c.isascii()) / len(latin) < TEXT_LAYER_MIN_ASCII_LATIN:
+            return False
+
+    if language and language != "auto":
+        if SCRIPT_LANG_MAP.get(script) not in language.split('+'):
+            return False
+    return True
+
+def pdf_page_count(pdf_path):
+    import fitz  # PyMuPDF
+    try:
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception as e:
+        raise RuntimeError(f"Failed to open PDF: {e}")
+
+def render_page(doc, page_index, dpi=OCR_DPI):
+    """ Rasterize a single page of an open fitz document to a grayscale PIL image. """
+    import fitz  # PyMuPDF
+    zoom = dpi / 72
+    pix = doc.load_page(page_index).get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+def iter_pdf_pages(pdf_path, dpi=OCR_DPI, language=None, use_text_layer=True):
+    """ Yield (page_number, text_layer, image) one page at a time so only the
+    pages currently being OCR'd are held in memory. When a page has a usable
+    embedded text layer it is returned as `text_layer` and the page is not
+    rasterized (`image` is None). Pages PyMuPDF cannot render fall back to
+    poppler via pdf2image. """
+    import fitz  # PyMuPDF
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        raise RuntimeError(f"Failed to convert PDF: {e}")
+
+    try:
+        for page_index in range(doc.page_count):
+            page_number = page_index + 1
+
+            if use_text_layer:
+                try:
+                    text = doc.load_page(page_index).get_text("text")
+                except Exception:
+                    text = ""
+                if usable_text_layer(text, language):
+                    yield page_number, text, None
+                    continue
+
+            try:
+                image = render_page(doc, page_index, dpi)
+            except Exception:
+                try:
+                    from pdf2image import convert_from_path
+                    image = convert_from_path(
+                        pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, poppler_path=poppler_path
+                    )[0]
+                except Exception as e:
+                    raise RuntimeError(f"Failed to convert page {page_number}: {e}")
+            yield page_number, None, image
+    finally:
+        doc.close()
+
+def preprocess_image(image, pipeline="legacy", dpi=None):
+    image, _ = run_pipeline(image, pipeline, dpi)
+    return image
+
+# ------------------------ LANGUAGE DISCOVERY ------------------------
+# `tesseract --list-langs` is a subprocess, so the result is cached per process
+# and only recomputed when the tessdata directory changes (a model was added
+# or removed) or refresh_languages() is called. Nothing runs at startup; the
+# first request that needs the list pays for it.
+#
+# Models that are not in the active tessdata directory (the packaged build
+# bundles only English) are looked up in OCR_MODEL_DIRS and linked into it
+# the first time a page asks for that language.
+
+def _default_model_dirs():
+    if not getattr(sys, 'frozen', False):
+        return []
+    # staticx runs the bundle from a temporary copy; STATICX_PROG_PATH is the real binary
+    executable = os.environ.get("STATICX_PROG_PATH", sys.executable)
+    return [os.path.join(os.path.dirname(os.path.abspath(executable)), "tessdata")]
+
+OCR_MODEL_DIRS = [d for d in os.environ.get("OCR_MODEL_DIRS", "").split(os.pathsep) if d] or _default_model_dirs()
+
+_languages = None
+_languages_mtime = None
+_languages_lock = threading.Lock()
+
+def _tessdata_mtime():
+    try:
+        return os.stat(os.environ.get('TESSDATA_PREFIX', '')).st_mtime
+    except OSError:
+        return None
+
+def refresh_languages():
+    global _languages, _languages_mtime
+    with _languages_lock:
+        _languages_mtime = _tessdata_mtime()
+        try:
+            _languages = set(get_backend().get_languages()) | set(external_models())
+        except Exception as e:
+            logger.error("Could not list Tesseract languages: %s", e)
+            _languages = set()
+        logger.info("Available languages: %s", sorted(_languages))
+        return set(_languages)
+
+def available_languages():
+    if _languages is None or _tessdata_mtime() != _languages_mtime:
+        return refresh_languages()
+    return _languages
+
+def external_models():
+    """ {language: path} for the .traineddata files in OCR_MODEL_DIRS. """
+    models = {}
+    for directory in reversed(OCR_MODEL_DIRS):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith(".traineddata"):
+                models[name[:-len(".traineddata")]] = os.path.join(directory, name)
+    return models
+
+def ensure_language_models(language):
+    """ Make the models for `language` ("eng+hin") available in tessdata,
+    linking (or copying) them from OCR_MODEL_DIRS on first use. """
+    tessdata = os.environ.get('TESSDATA_PREFIX', '')
+    missing = [lang for lang in language.split('+')
+               if not os.path.exists(os.path.join(tessdata, lang + ".traineddata"))]
+    if not missing or not OCR_MODEL_DIRS:
+        return
+    models = external_models()
+    with _languages_lock:
+        for lang in missing:
+            target = os.path.join(tessdata, lang + ".traineddata")
+            if lang not in models or os.path.exists(target):
+                continue
+            try:
+                os.symlink(models[lang], target)
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copyfile(models[lang], target)
+            logger.info("Loaded language model %s from %s", lang, models[lang])
+
+# ------------------------ SCRIPT DETECTION ------------------------
+
+def detect_script_with_confidence(image):
+    """ Run Tesseract OSD and return (script, confidence), or (None, 0.0). """
+    try:
+        ensure_language_models("osd")
+        return get_backend().detect_script(image)
+    except Exception:
+        return None, 0.0
+
+def detect_script(image) -> str:
+    script, _ = detect_script_with_confidence(image)
+    return script or "Latin"  # Default fallback
+
+def sample_page_indexes(page_count, sample_size):
+    """ Evenly spread page indexes, always including the first and last page. """
+    if page_count <= sample_size:
+        return list(range(page_count))
+    if sample_size <= 1:
+        return [0]
+    step = (page_count - 1) / (sample_size - 1)
+    return sorted({round(i * step) for i in range(sample_size)})
+
+def detect_document_language(pdf_path, dpi=OCR_DPI, sample_size=None):
+    """ Pick one OCR language for a whole document from OSD on a few sample
+    pages. Returns "auto" when the samples disagree or are low confidence,
+    which makes ocr_image detect each page on its own. """
+    import fitz  # PyMuPDF
+    sample_size = SCRIPT_SAMPLE_PAGES if sample_size is None else sample_size
+    if sample_size <= 0:
+        return "auto"
+
+    votes = Counter()
+    confidences = {}
+    with fitz.open(pdf_path) as doc:
+        for page_index in sample_page_indexes(doc.page_count, sample_size):
+            image = preprocess_image(render_page(doc, page_index, dpi))
+            script, confidence = detect_script_with_confidence(image)
+            if script:
+                votes[script] += confidence
+                confidences.setdefault(script, []).append(confidence)
+
+    if not votes:
+        return "auto"
+    script, _ = votes.most_common(1)[0]
+    # Average over all samples, so a script seen on one page out of three scores low
+    confidence = sum(confidences[script]) / max(1, sum(len(c) for c in confidences.values()))
+    if confidence < SCRIPT_MIN_CONFIDENCE or script not in SCRIPT_LANG_MAP:
+        logger.info("Document script unclear (script=%s confidence=%.2f); detecting per page", script, confidence)
+        return "auto"
+    logger.info("Document script: script=%s confidence=%.2f", script, confidence)
+    return SCRIPT_LANG_MAP[script]
+
+# ------------------------ PAGE OCR ------------------------
+
+# Tesseract rejects images taller than 32767 px, so composites are split
+MAX_COMPOSITE_HEIGHT = 30000
+
+def data_words(data, dx=0, dy=0):
+    """ Word boxes from image_to_data output, shifted by (dx, dy). """
+    words = []
+    for i in range(len(data['text'])):
+        word = data['text'][i].strip()
+        if not word or int(float(data['conf'][i])) == -1:
+            continue
+        words.append({"text": word, "left": data['left'][i] + dx, "top": data['top'][i] + dy,
+                      "width": data['width'][i], "height": data['height'][i]})
+    return words
+
+def data_text(data):
+    """ Page text from image_to_data output: one line per Tesseract line,
+    a blank line between paragraphs, as image_to_string lays it out. """
+    paragraphs = {}
+    for i in range(len(data['text'])):
+        word = data['text'][i].strip()
+        if not word or int(float(data['conf'][i])) == -1:
+            continue
+        paragraph = paragraphs.setdefault((data['block_num'][i], data['par_num'][i]), {})
+        paragraph.setdefault(data['line_num'][i], []).append(word)
+    return "\n\n".join(
+        "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+        for _, lines in sorted(paragraphs.items())
+    )
+
+def _composite_batches(crops, gap):
+    batch, height = [], 0
+    for index, crop in enumerate(crops):
+        if batch and height + crop.height + gap > MAX_COMPOSITE_HEIGHT:
+            yield batch
+            batch, height = [], 0
+        batch.append(index)
+        height += crop.height + gap
+    if batch:
+        yield batch
+
+def _ocr_composite(crops, lang, gap):
+    """ Stack line crops vertically on a white canvas, OCR it once and map
+    every recognised word back to the crop whose band contains it. """
+    width = max(crop.width for crop in crops)
+    height = sum(crop.height for crop in crops) + gap * (len(crops) + 1)
+    mode = crops[0].mode
+    composite = Image.new(mode, (width + 2 * gap, height), 255 if mode in ('1', 'L') else 'white')
+
+    bands = []
+    y = gap
+    for crop in crops:
+        composite.paste(crop, (gap, y))
+        bands.append((y, y + crop.height))
+        y += crop.height + gap
+
+    # --psm 6: one uniform block of text, so the stacked lines are read top to bottom
+    data = get_backend().image_to_data(composite, lang=lang, psm=6)
+
+    # band index -> tesseract line key -> words
+    band_lines = [dict() for _ in crops]
+    band_boxes = [[] for _ in crops]
+    for i in range(len(data['text'])):
+        word = data['text'][i].strip()
+        if not word or int(float(data['conf'][i])) == -1:
+            continue
+        center = data['top'][i] + data['height'][i] / 2
+        for band_index, (top, bottom) in enumerate(bands):
+            if top - gap / 2 <= center < bottom + gap / 2:
+                key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+                band_lines[band_index].setdefault(key, []).append((data['left'][i], word))
+                band_boxes[band_index].append({
+                    "text": word, "left": data['left'][i] - gap, "top": data['top'][i] - top,
+                    "width": data['width'][i], "height": data['height'][i],
+                })
+                break
+
+    texts = []
+    for line_words in band_lines:
+        lines = [" ".join(word for _, word in sorted(words)) for _, words in sorted(line_words.items())]
+        texts.append("\n".join(lines).strip())
+    return texts, band_boxes
+
+def ocr_line_crops(crops, lang, crop_words=None):
+    """ OCR many single-line crops with one Tesseract run per composite
+    instead of one process per line. Returns texts in crop order. If
+    `crop_words` is a list it receives each crop's word boxes, relative
+    to the crop. """
+    if not crops:
+        return []
+    gap = max(20, max(crop.height for crop in crops))
+    texts = [""] * len(crops)
+    boxes = [[] for _ in crops]
+    for batch in _composite_batches(crops, gap):
+        try:
+            batch_texts, batch_boxes = _ocr_composite([crops[i] for i in batch], lang, gap)
+        except Exception as e:
+            logger.warning("Batched line OCR failed, falling back to per-line OCR: %s", e)
+            batch_texts = [get_backend().image_to_string(crops[i], lang=lang).strip() for i in batch]
+            batch_boxes = [[] for _ in batch]
+        for index, text, words in zip(batch, batch_texts, batch_boxes):
+            texts[index] = text
+            boxes[index] = words
+    if crop_words is not None:
+        crop_words.extend(boxes)
+    return texts
+
+def ocr_image(image, lang, words=None):
+    """ OCR a preprocessed page image. If `words` is a list, word boxes
+    ({"text", "left", "top", "width", "height"}) are appended to it. """
+    try:
+        languages = available_languages()
+        
+        if lang == "auto":
+            with stage("script_detection"):
+                script = detect_script(image)
+            lang = SCRIPT_LANG_MAP.get(script, "eng")
+            
+        # Filter requested languages
+        requested_langs = lang.split('+')
+        valid_langs = [l for l in requested_langs if l in languages]
+        
+        if not valid_langs:
+            logger.warning("No valid languages found in request '%s'. Falling back to 'eng' (if available) or first available.", lang)
+            if 'eng' in languages:
+                final_lang = 'eng'
+            elif languages:
+                final_lang = list(languages)[0]
+            else:
+                return None # No languages available at all
+        else:
+            final_lang = "+".join(valid_langs)
+        ensure_language_models(final_lang)
+            
+        logger.debug("Performing OCR with language(s): %s", final_lang)
+
+        # HYBRID LOGIC for mixed content (specifically mni+eng)
+        # Dictionary-based line switching
+        if 'mni' in valid_langs and 'eng' in valid_langs:
+             logger.debug("Using Hybrid Line-Based Dictionary OCR for mixed content")
+             
+             # 1. Layout analysis with 'eng' to find lines
+             with stage("layout"):
+                 data = get_backend().image_to_data(image, lang='eng')
+             
+             if 'text' not in data:
+                 with stage("recognize"):
+                     return get_backend().image_to_string(image, lang=final_lang)
+
+             n_boxes = len(data['text'])
+             lines = {}
+             
+             # Group by line
+             for i in range(n_boxes):
+                 if int(data['conf'][i]) == -1: continue
+                 
+                 # Key: (block, par, line)
+                 key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+                 
+                 if key not in lines:
+                     lines[key] = {
+                         'text': [], 'conf': [],
+                         'left': [], 'top': [], 'width': [], 'height': []
+                     }
+                 
+                 lines[key]['text'].append(data['text'][i])
+                 lines[key]['conf'].append(data['conf'][i])
+                 lines[key]['left'].append(data['left'][i])
+                 lines[key]['top'].append(data['top'][i])
+                 lines[key]['width'].append(data['width'][i])
+                 lines[key]['height'].append(data['height'][i])
+
+             sorted_keys = sorted(lines.keys())
+             # Each entry is either English text or an index into mni_crops
+             entries = []
+             mni_crops = []
+             crop_origins = []
+             
+             for key in sorted_keys:
+                 l_data = lines[key]
+                 line_text_eng = " ".join(l_data['text']).strip()
+                 
+                 if not line_text_eng: continue
+                 
+                 # Check English Score
+                 tokens = [re.sub(r'[^a-zA-Z]', '', t).lower() for t in line_text_eng.split()]
+                 tokens = [t for t in tokens if t]
+                 
+                 is_eng = False
+                 if tokens:
+                     match_count = sum(1 for t in tokens if t in COMMON_ENG_WORDS)
+                     score = match_count / len(tokens)
+                     if score >= 0.2: # Threshold
+                         is_eng = True
+                 
+                 if is_eng:
+                     entries.append(line_text_eng)
+                     if words is not None:
+                         words.extend(data_words(l_data))
+                 else:
+                     # Queue line for MNI re-OCR
+                     x_min = min(l_data['left'])
+                     y_min = min(l_data['top'])
+                     x_max = max([l+w for l, w in zip(l_data['left'], l_data['width'])])
+                     y_max = max([t+h for t, h in zip(l_data['top'], l_data['height'])])
+                     
+                     padding = 5
+                     crop = image.crop((
+                         max(0, x_min - padding),
+                         max(0, y_min - padding),
+                         min(image.width, x_max + padding),
+                         min(image.height, y_max + padding)
+                     ))
+                     entries.append(len(mni_crops))
+                     mni_crops.append(crop)
+                     crop_origins.append((max(0, x_min - padding), max(0, y_min - padding)))
+
+             # 2. Re-OCR all non-English lines of the page in one Tesseract call
+             crop_words = [] if words is not None else None
+             with stage("line_ocr"):
+                 mni_texts = ocr_line_crops(mni_crops, 'mni', crop_words)
+             if words is not None:
+                 for (dx, dy), boxes in zip(crop_origins, crop_words):
+                     words.extend({**box, "left": box["left"] + dx, "top": box["top"] + dy} for box in boxes)
+
+             final_text = ""
+             for entry in entries:
+                 if isinstance(entry, int):
+                     final_text += mni_texts[entry] + "\n"
+                 else:
+                     final_text += entry + "\n"
+                     
+             return final_text
+
+        with stage("recognize"):
+            if words is None:
+                return get_backend().image_to_string(image, lang=final_lang)
+            data = get_backend().image_to_data(image, lang=final_lang)
+        words.extend(data_words(data))
+        return data_text(data)
+    except Exception as e:
+        logger.error("OCR error: %s", e)
+        return None
+
+def default_page_workers():
+    return OCR_PAGE_WORKERS or os.cpu_count() or 1
+
+def ocr_page(page_number, image, language, preprocess=None, dpi=OCR_DPI, keep_words=False):
+    """ OCR one rendered page, reusing the cached result for identical pages.
+    With keep_words the page also gets "words" (boxes in rendered image
+    pixels) and "image_size" for building a searchable PDF. """
+    language = language or "auto"
+    pipeline = resolve_pipeline(preprocess)
+    cache_key = ocr_cache.page_key(image, language, pipeline)
+    cached = ocr_cache.get_page(cache_key, need_words=keep_words)
+    if cached is not None:
+        page = {"page_number": page_number, **cached, "cached": True, "timings": {"preprocess": {}}}
+    else:
+        context = {}
+        processed, preprocess_timings = run_pipeline(image, ",".join(pipeline), dpi, context)
+        words = [] if keep_words else None
+        with collect_stages() as stage_timings:
+            text = ocr_image(processed, lang=language, words=words)
+        logger.debug("Page %s: %d characters recognised", page_number, len(text or ""))
+        page = {
+            "page_number": page_number,
+            "text": text if text else "",
+            "status": "success" if text else "ocr_failed",
+            "timings": {"preprocess": preprocess_timings, **stage_timings}
+        }
+        if words is not None:
+            page["words"] = []
+            for word in words:
+                left, top, width, height = to_source_box(word["left"], word["top"], word["width"], word["height"], context)
+                page["words"].append({"text": word["text"], "left": left, "top": top, "width": width, "height": height})
+        # ocr_image returns None on errors; only store real results
+        if text is not None:
+            ocr_cache.store_page(cache_key, page["text"], page["status"], page.get("words"))
+
+    if keep_words:
+        page.setdefault("words", [])
+        page["image_size"] = image.size
+    else:
+        page.pop("words", None)
+    return page
+
+def text_layer_page(page_number, text):
+    return {
+        "page_number": page_number,
+        "text": text.strip(),
+        "status": "text_layer"
+    }
+
+def extract_text_from_pdf(pdf_path, language, doc_id, original_filename, progress=None, workers=None, dpi=None,
+                          use_text_layer=True, preprocess=None, keep_words=False):
+    """ OCR every page of a PDF. `progress(pages_done, page_count)` is called
+    after each page; it may raise to abort the run (e.g. job cancellation).
+    Pages are rasterized lazily and run on `workers` threads (each driving
+    its own Tesseract process) with at most two pages per worker in flight,
+    so peak memory does not grow with the page count. Pages with a usable
+    embedded text layer skip OCR and get status "text_layer". With
+    language "auto" the script is detected once per document from sample
+    pages (see detect_document_language). `preprocess` names the image
+    preprocessing pipeline (see preprocessing.py); each page records its
+    per-step timings under "timings", next to the other stage timings in
+    milliseconds (see metrics.py). keep_words keeps word boxes on OCR'd
+    pages (see ocr_page). Results stay in page order. """
+    page_count = pdf_page_count(pdf_path)
+    if not page_count:
+        return None
+
+    result = {
+        "id": doc_id,
+        "source_file": original_filename,
+        "language": language,
+        "page_count": page_count,
+        "pages": [],
+        "timings": {}
+    }
+
+    if progress:
+        progress(0, page_count)
+
+    workers = workers or default_page_workers()
+    max_in_flight = workers * 2
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    # page number -> ms spent reading the text layer and rasterizing
+    read_ms = {}
+
+    def collect_oldest():
+        page = pending.popleft().result()
+        page.setdefault("timings", {})["rasterize"] = read_ms.pop(page["page_number"], 0.0)
+        result["pages"].append(page)
+        if progress:
+            progress(len(result["pages"]), page_count)
+
+    language = language or "auto"
+    ocr_language = None
+
+    pages = iter_pdf_pages(pdf_path, dpi or OCR_DPI, language, use_text_layer)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                page_number, text, image = next(pages)
+            except StopIteration:
+                break
+            read_ms[page_number] = round((time.perf_counter() - started) * 1000, 2)
+            if image is None:
+                pending.append(executor.submit(text_layer_page, page_number, text))
+                continue
+            if ocr_language is None:
+                # Only documents that actually need OCR pay for script detection
+                if language == "auto":
+                    with collect_stages() as document_timings:
+                        with stage("script_detection"):
+                            ocr_language = detect_document_language(pdf_path, dpi or OCR_DPI)
+                    result["timings"].update(document_timings)
+                else:
+                    ocr_language = language
+            pending.append(executor.submit(ocr_page, page_number, image, ocr_language, preprocess,
+                                           dpi or OCR_DPI, keep_words))
+            if len(pending) >= max_in_flight:
+                collect_oldest()
+        while pending:
+            collect_oldest()
+    finally:
+        pages.close()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return result
+
+def crop_region(image, region):
+    """ Crop to `region` = (x0, y0, x1, y1) given as fractions of the page size. """
+    x0, y0, x1, y1 = region
+    return image.crop((round(x0 * image.width), round(y0 * image.height),
+                       round(x1 * image.width), round(y1 * image.height)))
+
+def reocr_pages(pdf_path, page_numbers, language, doc_id, progress=None, workers=None, dpi=None,
+                preprocess=None, region=None, replace_page=False):
+    """ OCR only the given pages of an already ingested document, optionally
+    limited to a region of each page (see crop_region). Returns a partial
+    result ({"partial": True}) holding just those pages. Embedded text
+    layers are ignored since the point is to replace the current text.
+    Region text is merged into the stored page ("merge") unless
+    replace_page is set. """
+    import fitz  # PyMuPDF
+    dpi = dpi or OCR_DPI
+    language = language or "auto"
+    result = {"id": doc_id, "partial": True, "page_count": len(page_numbers), "pages": [], "timings": {}}
+    if progress:
+        progress(0, len(page_numbers))
+
+    workers = workers or default_page_workers()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    read_ms = {}
+
+    def collect_oldest():
+        page = pending.popleft().result()
+        page["timings"]["rasterize"] = read_ms.pop(page["page_number"], 0.0)
+        if region and not replace_page:
+            page["merge"] = True
+        result["pages"].append(page)
+        if progress:
+            progress(len(result["pages"]), len(page_numbers))
+
+    try:
+        with fitz.open(pdf_path) as doc:
+            for page_number in page_numbers:
+                started = time.perf_counter()
+                image = render_page(doc, page_number - 1, dpi)
+                read_ms[page_number] = round((time.perf_counter() - started) * 1000, 2)
+                if region:
+                    image = crop_region(image, region)
+                pending.append(executor.submit(ocr_page, page_number, image, language, preprocess, dpi))
+                if len(pending) >= workers * 2:
+                    collect_oldest()
+        while pending:
+            collect_oldest()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return result
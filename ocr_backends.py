@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+# ------------------------ OCR BACKENDS ------------------------
+# "tesserocr" keeps Tesseract engines loaded in-process (libtesseract via the
+# optional tesserocr package): each model is read from tessdata once per
+# engine and images are handed over in memory. "pytesseract" starts the
+# tesseract binary for every call and is the fallback when tesserocr is not
+# installed. OCR_BACKEND=auto picks tesserocr when it is available.
+# Both bindings are imported when the backend is first created, not when
+# this module is, so processes that never OCR never load them.
+
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")
+
+# Path of the tesseract binary for pytesseract (set by ocr.py)
+TESSERACT_CMD = None
+
+tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+DATA_KEYS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+             "left", "top", "width", "height", "conf", "text"]
+
+def parse_osd(osd):
+    """ Extract (script, confidence) from `tesseract --psm 0` output. """
+    script, confidence = None, 0.0
+    for line in osd.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip() == "Script":
+            script = value.strip()
+        elif key.strip() == "Script confidence":
+            confidence = float(value.strip())
+    return script, confidence
+
+class PytesseractBackend:
+    name = "pytesseract"
+
+    def __init__(self, tesseract_cmd=None):
+        import pytesseract
+        if tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+        self.pytesseract = pytesseract
+
+    def _config(self, psm):
+        return f"--psm {psm}" if psm is not None else ""
+
+    def get_languages(self):
+        return self.pytesseract.get_languages()
+
+    def image_to_string(self, image, lang, psm=None):
+        return self.pytesseract.image_to_string(image, lang=lang, config=self._config(psm))
+
+    def image_to_data(self, image, lang, psm=None):
+        return self.pytesseract.image_to_data(image, lang=lang, config=self._config(psm),
+                                              output_type=self.pytesseract.Output.DICT)
+
+    def detect_script(self, image):
+        return parse_osd(self.pytesseract.image_to_osd(image))
+
+class TesserocrBackend:
+    """ Pool of long-lived PyTessBaseAPI engines keyed by (lang, psm). An
+    engine is used by one thread at a time and returned to the pool after
+    each call, so a process ends up with at most one engine per concurrent
+    page worker and language combination, each loading its model once. """
+    name = "tesserocr"
+
+    def __init__(self, tessdata_path):
+        self.tessdata_path = tessdata_path
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def engine(self, lang, psm=None):
+        psm = tesserocr.PSM.AUTO if psm is None else psm
+        key = (lang, psm)
+        with self.lock:
+            engines = self.idle.setdefault(key, [])
+            api = engines.pop() if engines else None
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(path=self.tessdata_path, lang=lang, psm=psm)
+        try:
+            yield api
+        except Exception:
+            # Engine state is unknown after a failure; do not hand it out again
+            api.End()
+            raise
+        else:
+            api.Clear()
+            with self.lock:
+                self.idle[key].append(api)
+
+    def get_languages(self):
+        _, languages = tesserocr.get_languages(self.tessdata_path)
+        return languages
+
+    def image_to_string(self, image, lang, psm=None):
+        with self.engine(lang, psm) as api:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+    def image_to_data(self, image, lang, psm=None):
+        """ Same dict layout as pytesseract's image_to_data(output_type=DICT). """
+        with self.engine(lang, psm) as api:
+            api.SetImage(image)
+            api.Recognize()
+            tsv = api.GetTSVText(0)
+
+        data = {key: [] for key in DATA_KEYS}
+        for row in tsv.splitlines():
+            values = row.split("\t")
+            if len(values) < len(DATA_KEYS) - 1:
+                continue
+            values += [""] * (len(DATA_KEYS) - len(values))
+            for key, value in zip(DATA_KEYS, values):
+                if key == "text":
+                    data[key].append(value)
+                elif key == "conf":
+                    data[key].append(float(value))
+                else:
+                    data[key].append(int(value))
+        return data
+
+    def detect_script(self, image):
+        with self.engine("osd", tesserocr.PSM.OSD_ONLY) as api:
+            api.SetImage(image)
+            osd = api.DetectOrientationScript()
+        if not osd:
+            return None, 0.0
+        return osd.get("script_name"), float(osd.get("script_conf") or 0.0)
+
+    def close(self):
+        with self.lock:
+            for engines in self.idle.values():
+                for api in engines:
+                    api.End()
+            self.idle.clear()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+    return _backend
+
+def _import_tesserocr():
+    global tesserocr
+    try:
+        import tesserocr as module
+    except ImportError:
+        return False
+    tesserocr = module
+    return True
+
+def _create_backend():
+    if OCR_BACKEND in ("auto", "tesserocr"):
+        if _import_tesserocr():
+            tessdata_path = os.environ.get("TESSDATA_PREFIX", "")
+            if tessdata_path and not tessdata_path.endswith(os.sep):
+                tessdata_path += os.sep
+            logger.info("OCR backend: tesserocr (tessdata: %s)", tessdata_path)
+            return TesserocrBackend(tessdata_path)
+        if OCR_BACKEND == "tesserocr":
+            logger.warning("OCR_BACKEND=tesserocr but tesserocr is not installed; falling back to pytesseract")
+    logger.info("OCR backend: pytesseract")
+    return PytesseractBackend(TESSERACT_CMD)
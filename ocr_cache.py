@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, OcrPageCache
+
+# ------------------------ OCR PAGE CACHE ------------------------
+# OCR output per rendered page, keyed by a hash of the page pixels together
+# with the OCR language and preprocessing steps. Re-uploading a document, or
+# uploading one that shares pages with an earlier upload, reuses the stored
+# text instead of running Tesseract again. Set OCR_RESULT_CACHE=0 to disable.
+
+OCR_RESULT_CACHE = os.environ.get("OCR_RESULT_CACHE", "1") != "0"
+
+def page_key(image, language, pipeline):
+    """ Cache key for a rendered page. `pipeline` is the resolved list of step names. """
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    digest.update(f"|{language}|{','.join(pipeline)}".encode())
+    return digest.hexdigest()
+
+def get_page(key, need_words=False):
+    """ Cached {"text", "status"[, "words"]} for `key`, or None. Entries
+    stored without word boxes are a miss when `need_words` is set. Read
+    only: cache hits are counted by ocr_pages_total{status="cached"}. """
+    if not OCR_RESULT_CACHE:
+        return None
+    session = SessionLocal()
+    try:
+        entry = session.get(OcrPageCache, key)
+        if entry is None or (need_words and entry.words is None):
+            return None
+        page = {"text": entry.text, "status": entry.status}
+        if entry.words is not None:
+            page["words"] = json.loads(entry.words)
+        return page
+    finally:
+        session.close()
+
+def store_page(key, text, status, words=None):
+    if not OCR_RESULT_CACHE:
+        return
+    session = SessionLocal()
+    try:
+        entry = session.get(OcrPageCache, key)
+        if entry is None:
+            session.add(OcrPageCache(key=key, text=text, status=status,
+                                     words=json.dumps(words) if words is not None else None))
+        elif words is not None:
+            # Re-OCR'd to get word boxes for an entry stored without them
+            entry.words = json.dumps(words)
+        session.commit()
+    except IntegrityError:
+        # Another worker cached the same page first
+        session.rollback()
+    finally:
+        session.close()
+
+def clear():
+    session = SessionLocal()
+    try:
+        deleted = session.query(OcrPageCache).delete()
+        session.commit()
+        return deleted
+    finally:
+        session.close()
@@ -0,0 +1,179 @@
+import os
+import hashlib
+import shutil
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+
+# ------------------------ RENDERED PAGE CACHE ------------------------
+# Rendered page images are cached in two tiers: a small in-memory LRU for the
+# pages reviewers are flipping between right now, and an on-disk tier that
+# survives restarts. Both are bounded by size and keyed by
+# (doc_id, page_number, scale, format).
+
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", os.path.join("cache", "pages"))
+PAGE_CACHE_MEMORY_MB = int(os.environ.get("PAGE_CACHE_MEMORY_MB", "64"))
+PAGE_CACHE_DISK_MB = int(os.environ.get("PAGE_CACHE_DISK_MB", "1024"))
+
+THUMBNAIL_WIDTH = 200
+
+IMAGE_FORMATS = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+# PyMuPDF is not thread safe, and FastAPI runs sync endpoints on a thread pool
+_render_lock = threading.Lock()
+
+class MemoryLRU:
+    """ Byte-bounded LRU of key -> (data, etag). """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, data, etag):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self.entries[key] = (data, etag)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, doc_id):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == doc_id]:
+                data, _ = self.entries.pop(key)
+                self.size -= len(data)
+
+class DiskCache:
+    """ Size-bounded directory of rendered pages, evicting least recently used
+    files (by mtime, which is refreshed on every hit) when over budget. """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = threading.Lock()
+
+    def _path(self, key):
+        doc_id, page_number, scale, fmt = key
+        return os.path.join(self.directory, doc_id, f"{page_number}_{scale:g}.{fmt}")
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self._files())
+            else:
+                self.size += len(data)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop down to 90% of the budget so eviction is not run on every write
+        target = self.max_bytes * 0.9
+        files = sorted(self._files(), key=lambda f: f[2])
+        self.size = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                pass
+
+    def invalidate(self, doc_id):
+        with self.lock:
+            shutil.rmtree(os.path.join(self.directory, doc_id), ignore_errors=True)
+            self.size = None
+
+memory_cache = MemoryLRU(PAGE_CACHE_MEMORY_MB * 1024 * 1024)
+disk_cache = DiskCache(PAGE_CACHE_DIR, PAGE_CACHE_DISK_MB * 1024 * 1024)
+
+def make_etag(data):
+    return '"' + hashlib.md5(data).hexdigest() + '"'
+
+def render_page_image(pdf_path, page_number, scale, fmt, thumbnail=False):
+    import fitz  # PyMuPDF
+    with _render_lock:
+        with fitz.open(pdf_path) as doc:
+            if not (0 < page_number <= doc.page_count):
+                raise IndexError("Page number out of range")
+            page = doc.load_page(page_number - 1)
+            if thumbnail:
+                scale = THUMBNAIL_WIDTH / page.rect.width
+            pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+            if fmt == "png":
+                return pix.pil_tobytes(format="PNG")
+            image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=80)
+    return buffer.getvalue()
+
+def get_page_image(doc_id, pdf_path, page_number, scale=1.0, fmt="png", thumbnail=False):
+    """ Return (image_bytes, etag) for a page, rendering it only on a cache miss. """
+    # Thumbnails are a fixed width, so they share one cache entry whatever the scale
+    key = (doc_id, page_number, 0.0 if thumbnail else scale, fmt)
+
+    entry = memory_cache.get(key)
+    if entry is not None:
+        return entry
+
+    data = disk_cache.get(key)
+    if data is None:
+        data = render_page_image(pdf_path, page_number, scale, fmt, thumbnail)
+        disk_cache.put(key, data)
+
+    etag = make_etag(data)
+    memory_cache.put(key, data, etag)
+    return data, etag
+
+def invalidate_document(doc_id):
+    memory_cache.invalidate(doc_id)
+    disk_cache.invalidate(doc_id)
@@ -0,0 +1,209 @@
+import math
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+# ------------------------ IMAGE PREPROCESSING ------------------------
+# A preprocessing pipeline is a list of named steps applied to a page image
+# before OCR. Steps work on NumPy arrays instead of per-pixel Python
+# callbacks. A pipeline is chosen by profile name or as a comma separated
+# list of step names ("grayscale,deskew,sauvola").
+
+OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "legacy")
+
+# Resolution normalize_dpi resamples pages to; Tesseract works best around 300
+OCR_TARGET_DPI = int(os.environ.get("OCR_TARGET_DPI", "300"))
+
+def _gray_array(image):
+    if image.mode != "L":
+        image = image.convert("L")
+    return np.asarray(image, dtype=np.uint8)
+
+def _binary_image(mask):
+    """ Boolean "is background" mask -> black/white PIL image (mode '1'). """
+    return Image.fromarray(mask)
+
+def grayscale(image, context):
+    return image if image.mode == "L" else image.convert("L")
+
+def threshold(image, context):
+    """ Fixed global threshold at 128 (the original preprocessing). """
+    return _binary_image(_gray_array(image) >= 128)
+
+def otsu_level(gray):
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_bg = np.cumsum(histogram)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(histogram * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    between_class = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between_class))
+
+def otsu(image, context):
+    gray = _gray_array(image)
+    return _binary_image(gray > otsu_level(gray))
+
+def _window_sums(values, window):
+    """ Sum over a window x window neighbourhood of every pixel via an integral image. """
+    half = window // 2
+    padded = np.pad(values, half + 1, mode="edge")
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    h, w = values.shape
+    return (integral[window:window + h, window:window + w]
+            - integral[0:h, window:window + w]
+            - integral[window:window + h, 0:w]
+            + integral[0:h, 0:w])
+
+def sauvola(image, context, window=25, k=0.2, dynamic_range=128.0):
+    """ Local threshold T = mean * (1 + k * (std / R - 1)); copes with faded
+    ink and uneven lighting that defeat a single global threshold. """
+    gray = _gray_array(image).astype(np.float64)
+    area = float(window * window)
+    mean = _window_sums(gray, window) / area
+    variance = _window_sums(gray * gray, window) / area - mean * mean
+    std = np.sqrt(np.maximum(variance, 0))
+    limit = mean * (1 + k * (std / dynamic_range - 1))
+    return _binary_image(gray > limit)
+
+def deskew(image, context, max_angle=5.0, step=0.25):
+    """ Rotate so text lines are horizontal. Candidate angles are scored by
+    how sharply the row profile of dark pixels peaks on a downscaled copy. """
+    gray = grayscale(image, context)
+    small = gray.copy()
+    small.thumbnail((800, 800))
+    dark = Image.fromarray(((_gray_array(small) < 128) * 255).astype(np.uint8))
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        profile = np.asarray(dark.rotate(angle, resample=Image.NEAREST), dtype=np.float64).sum(axis=1)
+        score = float(np.sum(np.diff(profile) ** 2))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+
+    context["skew_angle"] = best_angle
+    if abs(best_angle) < step / 2:
+        return gray
+    rotated = gray.rotate(best_angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    context["geometry"].append(("rotate", best_angle, gray.size, rotated.size))
+    return rotated
+
+def crop_border(image, context, margin=20, dark_fraction=0.6):
+    """ Trim black scanner borders, then crop white margins around the content. """
+    gray = grayscale(image, context)
+    dark = _gray_array(gray) < 128
+    if not dark.any():
+        return gray
+
+    rows, cols = dark.mean(axis=1), dark.mean(axis=0)
+    top, bottom = 0, len(rows)
+    while top < bottom and rows[top] > dark_fraction:
+        top += 1
+    while bottom > top and rows[bottom - 1] > dark_fraction:
+        bottom -= 1
+    left, right = 0, len(cols)
+    while left < right and cols[left] > dark_fraction:
+        left += 1
+    while right > left and cols[right - 1] > dark_fraction:
+        right -= 1
+
+    content = dark[top:bottom, left:right]
+    if not content.any():
+        return gray
+    ys = np.flatnonzero(content.any(axis=1))
+    xs = np.flatnonzero(content.any(axis=0))
+    box = (
+        max(0, left + xs[0] - margin),
+        max(0, top + ys[0] - margin),
+        min(gray.width, left + xs[-1] + 1 + margin),
+        min(gray.height, top + ys[-1] + 1 + margin),
+    )
+    context["geometry"].append(("crop", int(box[0]), int(box[1])))
+    return gray.crop(box)
+
+def normalize_dpi(image, context):
+    """ Resample to OCR_TARGET_DPI from the resolution the page was rendered at. """
+    source_dpi = context.get("dpi")
+    if not source_dpi:
+        return image
+    scale = OCR_TARGET_DPI / source_dpi
+    context["dpi"] = OCR_TARGET_DPI
+    if abs(scale - 1) < 0.05:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    context["geometry"].append(("scale", size[0] / image.width, size[1] / image.height))
+    return image.resize(size, Image.LANCZOS)
+
+STEPS = {
+    "grayscale": grayscale,
+    "threshold": threshold,
+    "otsu": otsu,
+    "sauvola": sauvola,
+    "deskew": deskew,
+    "crop_border": crop_border,
+    "normalize_dpi": normalize_dpi,
+}
+
+PROFILES = {
+    "legacy": ["grayscale", "threshold"],
+    "otsu": ["grayscale", "otsu"],
+    "adaptive": ["grayscale", "normalize_dpi", "crop_border", "deskew", "sauvola"],
+    "none": ["grayscale"],
+}
+
+def resolve_pipeline(name=None):
+    """ Step names for a profile name or comma separated step list.
+    Raises ValueError for unknown names. """
+    name = (name or OCR_PREPROCESS).strip()
+    if name in PROFILES:
+        return list(PROFILES[name])
+    steps = [step.strip() for step in name.split(",") if step.strip()]
+    unknown = [step for step in steps if step not in STEPS]
+    if not steps or unknown:
+        raise ValueError(
+            f"Unknown preprocessing '{name}'. Use a profile ({', '.join(PROFILES)}) "
+            f"or a comma separated list of steps ({', '.join(STEPS)})"
+        )
+    return steps
+
+def run_pipeline(image, pipeline=None, dpi=None, context=None):
+    """ Apply a preprocessing pipeline. Returns (image, timings) where timings
+    maps each step name to its duration in milliseconds. Pass a `context`
+    dict to keep the geometry changes for to_source_box. """
+    context = {} if context is None else context
+    context.update({"dpi": dpi, "geometry": []})
+    timings = {}
+    for step in resolve_pipeline(pipeline):
+        started = time.perf_counter()
+        image = STEPS[step](image, context)
+        timings[step] = round((time.perf_counter() - started) * 1000, 2)
+    return image, timings
+
+def _to_source_point(x, y, geometry):
+    for operation in reversed(geometry):
+        if operation[0] == "scale":
+            x, y = x / operation[1], y / operation[2]
+        elif operation[0] == "crop":
+            x, y = x + operation[1], y + operation[2]
+        elif operation[0] == "rotate":
+            # PIL rotates counter-clockwise about the centre; undo it
+            _, angle, (width, height), (new_width, new_height) = operation
+            theta = math.radians(angle)
+            dx, dy = x - new_width / 2, y - new_height / 2
+            x = dx * math.cos(theta) - dy * math.sin(theta) + width / 2
+            y = dx * math.sin(theta) + dy * math.cos(theta) + height / 2
+    return x, y
+
+def to_source_box(left, top, width, height, context):
+    """ Map a box on the preprocessed image back to the input image. """
+    geometry = context.get("geometry") or []
+    if not geometry:
+        return left, top, width, height
+    corners = [_to_source_point(x, y, geometry)
+               for x, y in ((left, top), (left + width, top), (left, top + height), (left + width, top + height))]
+    xs = [x for x, _ in corners]
+    ys = [y for _, y in corners]
+    return round(min(xs)), round(min(ys)), round(max(xs) - min(xs)), round(max(ys) - min(ys))
@@ -0,0 +1,194 @@
+import re
+import unicodedata
+
+from sqlalchemy import text
+
+from database import engine
+
+# ------------------------ FULL-TEXT INDEX ------------------------
+# Page text in the pages table is indexed by an SQLite FTS5 external-content
+# table kept in sync by triggers, so storing, editing or deleting a page
+# updates only that page's index entries with no extra calls from the app.
+# unicode61 treats combining vowel signs and viramas as separators, which
+# would split Devanagari, Bengali and Meetei Mayek words into fragments, so
+# those marks are declared as token characters.
+
+INDIC_RANGES = [(0x0900, 0x097F), (0x0980, 0x09FF), (0xAAE0, 0xAAFF), (0xABC0, 0xABFF)]
+
+TOKEN_CHARS = "".join(
+    chr(code)
+    for lo, hi in INDIC_RANGES
+    for code in range(lo, hi + 1)
+    if unicodedata.category(chr(code)) in ("Mn", "Mc")
+)
+
+PHRASE_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# Objects from the index's first version, which kept its own copy of page text
+LEGACY_SCHEMA = [
+    "DROP TRIGGER IF EXISTS search_pages_ai",
+    "DROP TRIGGER IF EXISTS search_pages_ad",
+    "DROP TRIGGER IF EXISTS search_pages_au",
+    "DROP TABLE IF EXISTS page_fts",
+    "DROP TABLE IF EXISTS search_pages",
+]
+
+SCHEMA = [
+    "CREATE VIRTUAL TABLE pages_fts USING fts5("
+    "text, content='pages', content_rowid='id', "
+    f"tokenize=\"unicode61 remove_diacritics 2 tokenchars '{TOKEN_CHARS}'\")",
+
+    "CREATE TRIGGER IF NOT EXISTS pages_fts_ai AFTER INSERT ON pages BEGIN "
+    "INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text); END",
+
+    "CREATE TRIGGER IF NOT EXISTS pages_fts_ad AFTER DELETE ON pages BEGIN "
+    "INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+
+    "CREATE TRIGGER IF NOT EXISTS pages_fts_au AFTER UPDATE OF text ON pages BEGIN "
+    "INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text); END",
+]
+
+def init_index():
+    """ Create the index on first run and fill it from existing pages. The
+    write lock is taken before the check, so when several processes start at
+    once exactly one creates and fills the index. """
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pages_fts'"
+        )).first()
+        if not exists:
+            for statement in LEGACY_SCHEMA + SCHEMA:
+                conn.execute(text(statement))
+            conn.execute(text("INSERT INTO pages_fts (pages_fts) VALUES ('rebuild')"))
+        conn.commit()
+
+def rebuild_index():
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO pages_fts (pages_fts) VALUES ('rebuild')"))
+
+def build_match_expression(query):
+    """ Turn a user query into an FTS5 expression. "Quoted text" is matched
+    as an exact phrase; every other word must appear as a word prefix.
+    Words made only of punctuation are dropped. All parts are quoted so FTS5
+    syntax characters in the query are literal. """
+    parts = []
+    for phrase, word in PHRASE_RE.findall(query):
+        if phrase.strip():
+            parts.append('"' + phrase.replace('"', '""') + '"')
+        elif any(c.isalnum() for c in word):
+            parts.append('"' + word.replace('"', '""') + '"*')
+    return " AND ".join(parts)
+
+def search(query, limit=20, offset=0):
+    """ Rank documents by their best matching page (BM25).
+    Returns (total_documents, [{"id", "score", "matches": [{"page_number", "text", "score"}]}]). """
+    expression = build_match_expression(query)
+    if not expression:
+        return 0, []
+
+    params = {"q": expression, "limit": limit, "offset": offset}
+    with engine.connect() as conn:
+        total = conn.execute(text(
+            "SELECT COUNT(DISTINCT p.doc_id) FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid "
+            "WHERE pages_fts MATCH :q"
+        ), params).scalar()
+
+        docs = conn.execute(text(
+            "SELECT p.doc_id, MIN(pages_fts.rank) AS score FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid "
+            "WHERE pages_fts MATCH :q GROUP BY p.doc_id ORDER BY score LIMIT :limit OFFSET :offset"
+        ), params).all()
+        if not docs:
+            return total, []
+
+        doc_params = {f"d{i}": doc_id for i, (doc_id, _) in enumerate(docs)}
+        placeholders = ", ".join(f":{name}" for name in doc_params)
+        pages = conn.execute(text(
+            "SELECT p.doc_id, p.page_number, p.text, pages_fts.rank FROM pages_fts "
+            "JOIN pages p ON p.id = pages_fts.rowid "
+            f"WHERE pages_fts MATCH :q AND p.doc_id IN ({placeholders}) ORDER BY p.page_number"
+        ), {"q": expression, **doc_params}).all()
+
+    results = [{"id": doc_id, "score": -score, "matches": []} for doc_id, score in docs]
+    by_id = {result["id"]: result for result in results}
+    for doc_id, page_number, page_text, rank in pages:
+        by_id[doc_id]["matches"].append({"page_number": page_number, "text": page_text, "score": -rank})
+    return total, results
+
+def matching_document_ids(query, limit=100):
+    """ Ids of the best matching documents, without page text. """
+    expression = build_match_expression(query)
+    if not expression:
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT p.doc_id, MIN(pages_fts.rank) AS score FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid "
+            "WHERE pages_fts MATCH :q GROUP BY p.doc_id ORDER BY score LIMIT :limit"
+        ), {"q": expression, "limit": limit}).all()
+    return [doc_id for doc_id, _ in rows]
+
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+def _parse_snippet(marked):
+    """ Strip highlight markers from an FTS5 snippet, returning the plain
+    snippet and [start, end) offsets of the highlighted terms in it. """
+    snippet = []
+    highlights = []
+    length = 0
+    start = None
+    for c in marked:
+        if c == SNIPPET_START:
+            start = length
+        elif c == SNIPPET_END:
+            if start is not None:
+                highlights.append([start, length])
+            start = None
+        else:
+            snippet.append(c)
+            length += 1
+    return "".join(snippet), highlights
+
+def search_pages(query, limit=20, after=None, snippet_tokens=24):
+    """ Page-level hits with a highlighted snippet instead of the full page text.
+    Pages are ordered by (rank, page id); pass the `next_after` key of one call
+    as `after` to continue from there. Returns (total_pages, [{"doc_id",
+    "page_number", "score", "snippet", "highlights"}], next_after), where
+    next_after is None on the last page. """
+    expression = build_match_expression(query)
+    if not expression:
+        return 0, [], None
+
+    params = {"q": expression, "limit": limit + 1, "tokens": snippet_tokens}
+    keyset = ""
+    if after is not None:
+        # Keyset pagination: unlike OFFSET, SQLite does not rank and skip
+        # every earlier hit again for each further page
+        keyset = "AND (pages_fts.rank, p.id) > (:after_rank, :after_id) "
+        params["after_rank"], params["after_id"] = after
+    with engine.connect() as conn:
+        total = conn.execute(text("SELECT COUNT(*) FROM pages_fts WHERE pages_fts MATCH :q"), params).scalar()
+        rows = conn.execute(text(
+            "SELECT p.doc_id, p.page_number, pages_fts.rank, "
+            f"snippet(pages_fts, 0, '{SNIPPET_START}', '{SNIPPET_END}', '...', :tokens), p.id "
+            "FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid "
+            f"WHERE pages_fts MATCH :q {keyset}ORDER BY pages_fts.rank, p.id LIMIT :limit"
+        ), params).all()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = (rows[-1][2], rows[-1][4])
+
+    hits = []
+    for doc_id, page_number, rank, marked, _ in rows:
+        snippet, highlights = _parse_snippet(marked or "")
+        hits.append({
+            "doc_id": doc_id,
+            "page_number": page_number,
+            "score": -rank,
+            "snippet": snippet,
+            "highlights": highlights,
+        })
+    return total, hits, next_after
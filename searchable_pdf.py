@@ -0,0 +1,68 @@
+import os
+
+# ------------------------ SEARCHABLE PDF ------------------------
+# A copy of the uploaded PDF with the OCR words written over each scanned
+# page as invisible text (render mode 3), positioned on the word boxes
+# Tesseract reported. Viewers can then select, search and highlight text
+# on the original page image. Latin text uses Helvetica; MuPDF falls back
+# to its Noto fonts for other scripts. Fonts are subset before saving so
+# only the glyphs actually used are embedded. PyMuPDF is imported on first
+# use, so modules that only need searchable_pdf_path() do not load it.
+
+SEARCHABLE_PDF_DIR = os.environ.get("SEARCHABLE_PDF_DIR", os.path.join("uploads", "searchable"))
+
+def searchable_pdf_path(doc_id):
+    return os.path.join(SEARCHABLE_PDF_DIR, f"{doc_id}.pdf")
+
+def discard_searchable_pdf(doc_id):
+    """ Remove a document's searchable PDF, e.g. once its text layer no
+    longer matches the stored text after a re-OCR or an edit. """
+    try:
+        os.remove(searchable_pdf_path(doc_id))
+    except FileNotFoundError:
+        pass
+
+def add_text_layer(page, words, image_size, font):
+    """ Write invisible words onto a PDF page. Word boxes are in pixels of
+    the page as rendered (rotation applied), `image_size` that render's size. """
+    import fitz  # PyMuPDF
+    if not words:
+        return
+    zoom_x = page.rect.width / image_size[0]
+    zoom_y = page.rect.height / image_size[1]
+    # Page content lives in unrotated coordinates; on rotated pages every
+    # word is turned about its own baseline so it reads upright when shown
+    writer = fitz.TextWriter(page.rect)
+    for word in words:
+        unit_width = font.text_length(word["text"], fontsize=1)
+        if not unit_width or word["width"] <= 0:
+            continue
+        # Size the text so it spans the word box horizontally
+        fontsize = word["width"] * zoom_x / unit_width
+        baseline = fitz.Point(word["left"] * zoom_x, (word["top"] + word["height"]) * zoom_y) * page.derotation_matrix
+        if page.rotation:
+            word_writer = fitz.TextWriter(page.rect)
+            word_writer.append(baseline, word["text"], font=font, fontsize=fontsize)
+            word_writer.write_text(page, render_mode=3, morph=(baseline, fitz.Matrix(page.rotation)))
+        else:
+            writer.append(baseline, word["text"], font=font, fontsize=fontsize)
+    if not page.rotation:
+        writer.write_text(page, render_mode=3)
+
+def build_searchable_pdf(pdf_path, pages, out_path):
+    """ Save a copy of `pdf_path` with a text layer for every page in `pages`
+    (OCR page dicts carrying "words" and "image_size"). Pages that already had
+    a text layer are left untouched. """
+    import fitz  # PyMuPDF
+    font = fitz.Font("helv")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp_path = out_path + ".part"
+    with fitz.open(pdf_path) as doc:
+        for page_data in pages:
+            if page_data.get("words") and page_data.get("image_size"):
+                page = doc[page_data["page_number"] - 1]
+                add_text_layer(page, page_data["words"], page_data["image_size"], font)
+        doc.subset_fonts()
+        doc.save(tmp_path, garbage=3, deflate=True)
+    os.replace(tmp_path, out_path)
+    return out_path
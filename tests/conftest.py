@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# database.py binds its engine at import, so point it at a scratch database first
+_db_dir = tempfile.mkdtemp(prefix="docusearch-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
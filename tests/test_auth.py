@@ -0,0 +1,18 @@
+import pytest
+
+import auth
+
+def test_refresh_token_is_not_a_bearer_token():
+    auth.create_user("token-tester", auth.hash_password("secret"))
+    refresh_token = auth.issue_refresh_token("token-tester")
+
+    with pytest.raises(auth.InvalidToken):
+        auth.verify_access_token(refresh_token)
+    assert auth.check_refresh_token(refresh_token) == "token-tester"
+
+def test_access_token_cannot_refresh():
+    access_token = auth.create_access_token(data={"sub": "token-tester"})
+
+    assert auth.verify_access_token(access_token) == "token-tester"
+    with pytest.raises(auth.InvalidToken):
+        auth.check_refresh_token(access_token)
@@ -0,0 +1,94 @@
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from database import SessionLocal, Job
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    session = SessionLocal()
+    try:
+        session.query(Job).delete()
+        session.commit()
+    finally:
+        session.close()
+
+def add_job(status="queued", claimed_by=None, lease_expires_at=None, attempts=0):
+    job_id = str(uuid.uuid4())
+    session = SessionLocal()
+    try:
+        session.add(Job(id=job_id, doc_id=str(uuid.uuid4()), owner="tester", source_file="sample.pdf",
+                        status=status, claimed_by=claimed_by, lease_expires_at=lease_expires_at,
+                        attempts=attempts, pages_done=0))
+        session.commit()
+    finally:
+        session.close()
+    return job_id
+
+def load(job_id):
+    session = SessionLocal()
+    try:
+        return session.get(Job, job_id)
+    finally:
+        session.close()
+
+def test_concurrent_schedulers_claim_each_job_once():
+    job_ids = {add_job() for _ in range(40)}
+    claims = []
+
+    def scheduler(worker_id):
+        while True:
+            job_id = jobs.claim_next_job(worker_id)
+            if job_id is None:
+                return
+            claims.append((job_id, worker_id))
+
+    threads = [threading.Thread(target=scheduler, args=(f"worker-{i}",)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert Counter(job_id for job_id, _ in claims) == Counter(job_ids)
+    for job_id, worker_id in claims:
+        job = load(job_id)
+        assert (job.status, job.claimed_by, job.attempts) == ("running", worker_id, 1)
+
+def test_live_lease_is_not_claimed():
+    add_job("running", claimed_by="other", lease_expires_at=jobs.lease_expiry(), attempts=1)
+    assert jobs.claim_next_job("me") is None
+
+def test_expired_lease_is_claimed_again():
+    job_id = add_job("running", claimed_by="dead", lease_expires_at=datetime.utcnow() - timedelta(seconds=1),
+                     attempts=1)
+
+    assert jobs.claim_next_job("me") == job_id
+    job = load(job_id)
+    assert (job.status, job.claimed_by, job.attempts) == ("running", "me", 2)
+    assert job.lease_expires_at > datetime.utcnow()
+
+def test_job_fails_after_max_attempts():
+    job_id = add_job("running", claimed_by="dead", lease_expires_at=datetime.utcnow() - timedelta(seconds=1),
+                     attempts=jobs.JOB_MAX_ATTEMPTS)
+
+    assert jobs.claim_next_job("me") is None
+    job = load(job_id)
+    assert job.status == "failed"
+    assert f"{jobs.JOB_MAX_ATTEMPTS} attempts" in job.error
+    assert job.finished_at is not None
+
+def test_release_claimed_jobs_requeues_only_own_jobs():
+    lease = jobs.lease_expiry()
+    mine = [add_job("running", claimed_by="me", lease_expires_at=lease, attempts=n) for n in (1, 2)]
+    theirs = add_job("running", claimed_by="other", lease_expires_at=lease, attempts=1)
+
+    assert jobs.release_claimed_jobs("me") == 2
+
+    for job_id, attempts in zip(mine, (0, 1)):
+        job = load(job_id)
+        assert (job.status, job.claimed_by, job.lease_expires_at, job.attempts) == ("queued", None, None, attempts)
+    assert load(theirs).claimed_by == "other"
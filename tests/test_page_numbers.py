@@ -0,0 +1,18 @@
+import pytest
+from fastapi import HTTPException
+
+from main import parse_page_numbers
+
+def test_parses_lists_and_ranges():
+    assert parse_page_numbers("5-7, 1,3,6", 10) == [1, 3, 5, 6, 7]
+
+@pytest.mark.parametrize("pages", ["1-30000000", "0-2", "11", "3-1", "a-b", ""])
+def test_rejects_bad_selections(pages):
+    with pytest.raises(HTTPException) as error:
+        parse_page_numbers(pages, 10)
+    assert error.value.status_code == 400
+
+def test_reversed_range_is_explained():
+    with pytest.raises(HTTPException) as error:
+        parse_page_numbers("3-1", 10)
+    assert "reversed" in error.value.detail
@@ -0,0 +1,45 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from main import pdf_file_response
+
+CONTENT = bytes(range(100))
+
+@pytest.fixture
+def client(tmp_path):
+    pdf_path = tmp_path / "sample.pdf"
+    pdf_path.write_bytes(CONTENT)
+    app = FastAPI()
+
+    @app.get("/pdf")
+    def get_pdf(request: Request):
+        return pdf_file_response(str(pdf_path), "sample.pdf", request)
+
+    return TestClient(app)
+
+def test_whole_file_without_range(client):
+    response = client.get("/pdf")
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.content == CONTENT
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=10-19", 10, 19),
+    ("bytes=90-", 90, 99),        # open-ended
+    ("bytes=-5", 95, 99),         # suffix: the last 5 bytes
+    ("bytes=-500", 0, 99),        # suffix longer than the file
+    ("bytes=95-1000", 95, 99),    # end past the file is clamped
+])
+def test_satisfiable_ranges(client, header, start, end):
+    response = client.get("/pdf", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {start}-{end}/100"
+    assert response.headers["content-length"] == str(end - start + 1)
+    assert response.content == CONTENT[start:end + 1]
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=20-10", "bytes=-0", "bytes=-", "bytes=1-2,5-6", "items=0-1"])
+def test_unsatisfiable_ranges(client, header):
+    response = client.get("/pdf", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
@@ -0,0 +1,82 @@
+import os
+import uuid
+
+import document_store
+import jobs
+from database import SessionLocal, Job
+
+def make_document(source_file, content_hash=None):
+    doc_id = str(uuid.uuid4())
+    document_store.save_document({
+        "id": doc_id,
+        "source_file": source_file,
+        "content_hash": content_hash,
+        "language": "eng",
+        "page_count": 1,
+        "pages": [{"page_number": 1, "text": "text", "status": "success"}],
+    })
+    return doc_id
+
+def make_upload(tmp_path, name):
+    pdf_path = tmp_path / name
+    pdf_path.write_bytes(b"%PDF-1.4")
+    return str(pdf_path)
+
+def make_running_job(pdf_path, content_hash, options=None):
+    jobs._worker_id = "test-worker"
+    job_id = str(uuid.uuid4())
+    session = SessionLocal()
+    try:
+        session.add(Job(id=job_id, doc_id=str(uuid.uuid4()), owner="tester", source_file="a.pdf",
+                        pdf_path=pdf_path, content_hash=content_hash, options=options or "{}",
+                        status="running", claimed_by=jobs._worker_id, pages_done=0, attempts=1))
+        session.commit()
+    finally:
+        session.close()
+    return job_id
+
+def test_legacy_upload_kept_while_other_documents_use_it(tmp_path):
+    source_file = f"{uuid.uuid4()}.pdf"
+    pdf_path = make_upload(tmp_path, source_file)
+    doc_ids = [make_document(source_file) for _ in range(3)]
+
+    for doc_id in doc_ids[:-1]:
+        document_store.delete_document(doc_id)
+        jobs.release_upload(pdf_path, None, source_file)
+        assert os.path.exists(pdf_path)
+
+    document_store.delete_document(doc_ids[-1])
+    jobs.release_upload(pdf_path, None, source_file)
+    assert not os.path.exists(pdf_path)
+
+def test_hashed_upload_kept_while_other_documents_use_it(tmp_path):
+    content_hash = uuid.uuid4().hex
+    pdf_path = make_upload(tmp_path, f"{content_hash}.pdf")
+    first = make_document("a.pdf", content_hash)
+    second = make_document("b.pdf", content_hash)
+
+    document_store.delete_document(first)
+    jobs.release_upload(pdf_path, content_hash, "a.pdf")
+    assert os.path.exists(pdf_path)
+
+    document_store.delete_document(second)
+    jobs.release_upload(pdf_path, content_hash, "b.pdf")
+    assert not os.path.exists(pdf_path)
+
+def test_failed_upload_job_removes_its_upload(tmp_path):
+    content_hash = uuid.uuid4().hex
+    pdf_path = make_upload(tmp_path, f"{content_hash}.pdf")
+
+    jobs._finish_job(make_running_job(pdf_path, content_hash), "failed", error="OCR failed")
+
+    assert not os.path.exists(pdf_path)
+
+def test_failed_job_keeps_upload_another_document_uses(tmp_path):
+    content_hash = uuid.uuid4().hex
+    pdf_path = make_upload(tmp_path, f"{content_hash}.pdf")
+    make_document("a.pdf", content_hash)
+
+    jobs._finish_job(make_running_job(pdf_path, content_hash), "failed", error="OCR failed")
+    jobs._finish_job(make_running_job(pdf_path, content_hash, options='{"pages": [1]}'), "cancelled")
+
+    assert os.path.exists(pdf_path)
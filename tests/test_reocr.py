@@ -0,0 +1,102 @@
+import os
+import uuid
+from concurrent.futures import Future
+
+import document_store
+import jobs
+import searchable_pdf
+from database import SessionLocal, Job
+
+def make_document(texts):
+    doc_id = str(uuid.uuid4())
+    document_store.save_document({
+        "id": doc_id,
+        "source_file": "sample.pdf",
+        "language": "eng",
+        "page_count": len(texts),
+        "pages": [{"page_number": n, "text": text, "status": "success"} for n, text in enumerate(texts, 1)],
+    })
+    return doc_id
+
+def make_running_job(doc_id):
+    jobs._worker_id = "test-worker"
+    job_id = str(uuid.uuid4())
+    session = SessionLocal()
+    try:
+        session.add(Job(id=job_id, doc_id=doc_id, owner="tester", source_file="sample.pdf", status="running",
+                        claimed_by=jobs._worker_id, pages_done=0, attempts=1))
+        session.commit()
+    finally:
+        session.close()
+    return job_id
+
+def finish(job_id, result):
+    future = Future()
+    future.set_result(result)
+    jobs._job_done(job_id, future)
+    return jobs.get_job(job_id)
+
+def page_texts(doc_id):
+    return [(page["text"], page["status"]) for page in document_store.get_document(doc_id)["pages"]]
+
+def test_failed_reocr_keeps_stored_text():
+    doc_id = make_document(["first page", "second page"])
+    job_id = make_running_job(doc_id)
+    result = {"id": doc_id, "partial": True, "page_count": 2, "pages": [
+        {"page_number": 1, "text": "", "status": "ocr_failed"},
+        {"page_number": 2, "text": "", "status": "ocr_failed"},
+    ]}
+
+    job = finish(job_id, result)
+
+    assert job["status"] == "failed"
+    assert "1, 2" in job["error"]
+    assert page_texts(doc_id) == [("first page", "success"), ("second page", "success")]
+
+def test_partially_failed_reocr_updates_only_good_pages():
+    doc_id = make_document(["first page", "second page"])
+    job_id = make_running_job(doc_id)
+    result = {"id": doc_id, "partial": True, "page_count": 2, "pages": [
+        {"page_number": 1, "text": "new first page", "status": "success"},
+        {"page_number": 2, "text": "", "status": "ocr_failed"},
+    ]}
+
+    job = finish(job_id, result)
+
+    assert job["status"] == "completed"
+    assert "2" in job["error"]
+    assert page_texts(doc_id) == [("new first page", "success"), ("second page", "success")]
+
+def test_region_reocr_keeps_rest_of_page():
+    doc_id = make_document(["heading\n\nbody text"])
+    job_id = make_running_job(doc_id)
+    result = {"id": doc_id, "partial": True, "page_count": 1, "pages": [
+        {"page_number": 1, "text": "footnote", "status": "success", "merge": True},
+    ]}
+
+    assert finish(job_id, result)["status"] == "completed"
+    assert page_texts(doc_id) == [("heading\n\nbody text\n\nfootnote", "edited")]
+
+def test_region_reocr_can_replace_page():
+    doc_id = make_document(["old text"])
+    job_id = make_running_job(doc_id)
+    result = {"id": doc_id, "partial": True, "page_count": 1, "pages": [
+        {"page_number": 1, "text": "footnote", "status": "success"},
+    ]}
+
+    finish(job_id, result)
+    assert page_texts(doc_id) == [("footnote", "success")]
+
+def test_reocr_discards_stale_searchable_pdf(tmp_path, monkeypatch):
+    monkeypatch.setattr(searchable_pdf, "SEARCHABLE_PDF_DIR", str(tmp_path))
+    doc_id = make_document(["old text"])
+    path = searchable_pdf.searchable_pdf_path(doc_id)
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4")
+    job_id = make_running_job(doc_id)
+    result = {"id": doc_id, "partial": True, "page_count": 1, "pages": [
+        {"page_number": 1, "text": "new text", "status": "success"},
+    ]}
+
+    assert finish(job_id, result)["status"] == "completed"
+    assert not os.path.exists(path)
@@ -0,0 +1,32 @@
+import uuid
+
+import document_store
+import main
+import search_index
+
+def test_cursor_pages_through_every_hit_once():
+    search_index.init_index()
+    word = f"w{uuid.uuid4().hex[:8]}"
+    # Identical pages tie on rank, so the page id has to break the tie
+    for texts in (["x", f"{word} y"] * 4, [f"{word} y", f"{word} {word} z", f"{word} y"]):
+        document_store.save_document({
+            "id": str(uuid.uuid4()),
+            "source_file": "sample.pdf",
+            "language": "eng",
+            "page_count": len(texts),
+            "pages": [{"page_number": n, "text": text, "status": "success"} for n, text in enumerate(texts, 1)],
+        })
+
+    _, expected, _ = search_index.search_pages(word, limit=100)
+    seen = []
+    cursor = None
+    while True:
+        response = main.search_hits(word, 2, cursor)
+        seen += [(hit["doc_id"], hit["page_number"]) for hit in response["hits"]]
+        cursor = response["next_cursor"]
+        if cursor is None:
+            break
+
+    assert response["total"] == 7
+    assert seen == [(hit["doc_id"], hit["page_number"]) for hit in expected]
+    assert len(set(seen)) == 7
@@ -0,0 +1,32 @@
+import os
+
+import fitz  # PyMuPDF
+import pytest
+
+from ocr import usable_text_layer
+
+UPLOADS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
+
+def page_texts(name):
+    path = os.path.join(UPLOADS, name)
+    if not os.path.exists(path):
+        pytest.skip(f"{name} not available")
+    with fitz.open(path) as doc:
+        return [page.get_text("text") for page in doc]
+
+@pytest.mark.parametrize("language", ["auto", "eng"])
+def test_legacy_font_bengali_is_not_a_usable_text_layer(language):
+    # Bengali set in a non-Unicode font extracts as Latin-1/Extended mojibake
+    texts = page_texts("2023021495.pdf")
+    assert [n for n, text in enumerate(texts, 1) if usable_text_layer(text, language)] == []
+
+def test_english_text_layer_is_usable():
+    texts = page_texts("SG2rIr20251210013453.pdf")
+    assert all(usable_text_layer(text, "auto") for text in texts)
+    assert all(usable_text_layer(text, "eng") for text in texts)
+
+def test_unicode_meetei_mayek_needs_matching_language():
+    text = page_texts("Meitei Mayek judgement_order.pdf")[1]
+    assert usable_text_layer(text, "auto")
+    assert usable_text_layer(text, "mni")
+    assert not usable_text_layer(text, "eng")